@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+#
+# Pipeline builder and profile checks (MegaMosquito)
+#
+# This checks the pipeline builder (see "builder.py") and the pipeline
+# profiles (see "profiles.py"), with Gstreamer if it is there, but not
+# Deepstream (see "checks.py"):
+#
+#    python3 builder-test.py
+#
+# It checks:
+#   - that the spec from every profile in PROFILES passes "validate", with
+#     and without secondary inference stages, output pacing, and the
+#     software encoder, for one source and for several
+#   - that "validate" rejects specs with mistakes in them (e.g., duplicate
+#     names, loops, pads linked twice, unlinked elements, bad probes)
+#   - if Gstreamer (the "gi" module) is available, that "build" builds, and
+#     can run, a small pipeline of plain software elements (videotestsrc,
+#     capsfilter, queue, fakesink) with a probe on it, and that it rejects
+#     unknown elements and properties
+#
+# The exit status is 0 if all checks pass.
+#
+
+# Basic dependencies
+import os
+import sys
+
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import builder
+import profiles
+import pacing
+import secondary
+from checks import check
+import checks
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'secondary-inference.cfg')
+
+def probe_callback(pad, info, data):
+    return 0
+
+
+# The settings a profile expects (see "profiles.py"), with stand-ins for
+# the functions
+def settings(num_sources, stages, pacer, software_encoder):
+    return {
+        'sources': [lambda: None] * num_sources,
+        'probe': probe_callback,
+        'config_file': 'deepstream-rtsp.cfg',
+        'stages': stages,
+        'tracker_lib': 'libnvds_mot_klt.so',
+        'aarch64': False,
+        'mem_type': 3,
+        'mux_width': 1920,
+        'mux_height': 1080,
+        'output_width': 1200,
+        'output_height': 600,
+        'codec': 'H264',
+        'bitrate': '4000000',
+        'preset_level': 1,
+        'output_queue': 2,
+        'output_sync': 0,
+        'software_encoder': software_encoder,
+        'output_pacing': pacer,
+        'udp_host': '224.224.255.255',
+        'udp_port': 5400,
+        'rtsp_path': '/ds',
+    }
+
+
+def check_profiles():
+    stages = [(stage, '/tmp/secondary-%s.cfg' % stage.name) for stage in secondary.load_stages(CONFIG_FILE, 'vehicle-type,car-color')]
+    for name in sorted(profiles.PROFILES):
+        for num_sources in [1, 3]:
+            for with_stages in [False, True]:
+                for pacer in [False, True]:
+                    for software_encoder in [False, True]:
+                        what = '%s (%d sources, stages=%s, pacer=%s, software encoder=%s)' % (name, num_sources, with_stages, pacer, software_encoder)
+                        s = settings(num_sources, stages if with_stages else [], pacer, software_encoder)
+                        try:
+                            spec = profiles.PROFILES[name](s)
+                            builder.validate(spec)
+                        except ValueError as e:
+                            check(False, '%s: %s' % (what, e))
+                            continue
+                        names = [e['name'] for e in spec['elements']]
+                        check(('secondary-inference-car-color' in names) == with_stages, '%s: the secondary inference stages are %s' % (what, 'missing' if with_stages else 'there'))
+                        outputs = len(spec['outputs'])
+                        expected = { 'full': 1, 'metadata-only': 0, 'per-camera': num_sources }[name]
+                        check(outputs == expected, '%s: %d outputs, should be %d' % (what, outputs, expected))
+                        check(len(spec['pacers']) == (outputs if pacer else 0), '%s: %d paced outputs, should be %d' % (what, len(spec['pacers']), outputs if pacer else 0))
+                        for queue, output_name in spec['pacers']:
+                            check(queue in names, '%s: there is no pacer queue "%s"' % (what, queue))
+                            check(output_name in [path for port, path in spec['outputs']], '%s: the pacer for "%s" is not on an output' % (what, output_name))
+
+
+# A small, correct spec: a -> b -> c
+def good_spec():
+    return {
+        'elements': [
+            { 'name': 'a', 'factory': 'videotestsrc' },
+            { 'name': 'b', 'factory': 'queue' },
+            { 'name': 'c', 'factory': 'fakesink' },
+        ],
+        'links': [('a', 'b'), ('b', 'c')],
+        'probes': [('c.sink', probe_callback)],
+    }
+
+
+def check_rejected(what, spec, expected):
+    try:
+        builder.validate(spec)
+        check(False, 'validate: %s should be rejected' % what)
+    except ValueError as e:
+        check(expected in str(e), 'validate: %s was rejected, but not for "%s": %s' % (what, expected, e))
+    except Exception as e:
+        check(False, 'validate: %s raised %s, not ValueError' % (what, repr(e)))
+
+
+def check_validate():
+    try:
+        builder.validate(good_spec())
+    except ValueError as e:
+        check(False, 'validate: the good spec was rejected: %s' % e)
+
+    spec = good_spec()
+    spec['elements'].append({ 'name': 'b', 'factory': 'queue' })
+    check_rejected('a duplicate name', spec, 'listed more than once')
+
+    spec = good_spec()
+    spec['links'].append(('c', 'a'))
+    check_rejected('a loop', spec, 'loop')
+
+    spec = good_spec()
+    spec['elements'].append({ 'name': 'd', 'factory': 'fakesink' })
+    spec['links'].append(('b', 'd'))
+    check_rejected('a pad linked twice', spec, 'already linked')
+
+    spec = good_spec()
+    spec['elements'].append({ 'name': 'd', 'factory': 'queue' })
+    check_rejected('an unlinked element', spec, 'not linked to anything')
+
+    spec = good_spec()
+    spec['links'].append(('b', 'nowhere.sink'))
+    check_rejected('a link to a missing element', spec, 'no element "nowhere"')
+
+    spec = good_spec()
+    spec['elements'][1] = { 'name': 'b', 'factory': 'queue', 'make': lambda: None }
+    check_rejected('both "factory" and "make"', spec, 'one of "factory" or "make"')
+
+    spec = good_spec()
+    spec['probes'] = [('c.sink',)]
+    check_rejected('a probe with no callback', spec, 'a probe must be')
+
+    spec = good_spec()
+    spec['probes'] = [('c', probe_callback)]
+    check_rejected('a probe with no pad', spec, 'must be named')
+
+    spec = good_spec()
+    spec['probes'] = [('c.sink', 'not a function')]
+    check_rejected('a probe that is not callable', spec, 'not callable')
+
+    check_rejected('an empty spec', {}, 'no elements')
+
+
+def check_build():
+    try:
+        import gi
+        gi.require_version('Gst', '1.0')
+        from gi.repository import Gst
+    except (ImportError, ValueError):
+        print('Gstreamer is not available, so "build" is not checked')
+        return
+    Gst.init(None)
+
+    # videotestsrc -> capsfilter (caps given as a string) -> queue -> fakesink
+    buffers = []
+    def count(pad, info, data):
+        data.append(info.get_buffer().pts)
+        return Gst.PadProbeReturn.OK
+    spec = {
+        'elements': [
+            { 'name': 'source', 'factory': 'videotestsrc', 'properties': { 'num-buffers': 10 } },
+            { 'name': 'caps', 'factory': 'capsfilter', 'properties': { 'caps': 'video/x-raw, width=320, height=240' } },
+            { 'name': 'queue', 'factory': 'queue' },
+            { 'name': 'sink', 'factory': 'fakesink', 'properties': { 'sync': False } },
+        ],
+        'links': [('source', 'caps'), ('caps.src', 'queue.sink'), ('queue', 'sink')],
+        'probes': [('sink.sink', count, buffers)],
+    }
+    try:
+        pipeline, elements = builder.build(spec)
+    except ValueError as e:
+        check(False, 'build: the software pipeline was not built: %s' % e)
+        return
+    check(sorted(elements) == ['caps', 'queue', 'sink', 'source'], 'build: the elements returned are %s' % sorted(elements))
+    caps = elements['caps'].get_property('caps')
+    check(caps is not None and caps.get_structure(0).get_value('width') == 320, 'build: the caps string was not converted to caps')
+
+    # Run it to the end of the stream (or an error, or 10 seconds)
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(10 * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    check(message is not None and message.type == Gst.MessageType.EOS, 'build: the software pipeline did not run to the end of the stream')
+    check(len(buffers) == 10, 'build: the probe saw %d buffers, should be 10' % len(buffers))
+
+    # Things only "build" can catch
+    for what, element, expected in [
+            ('an unknown element factory', { 'name': 'b', 'factory': 'no-such-element' }, 'unable to create'),
+            ('an unknown property', { 'name': 'b', 'factory': 'queue', 'properties': { 'no-such-property': 1 } }, 'no property'),
+        ]:
+        spec = good_spec()
+        spec['elements'][1] = element
+        try:
+            builder.build(spec)
+            check(False, 'build: %s should be rejected' % what)
+        except ValueError as e:
+            check(expected in str(e), 'build: %s was rejected, but not for "%s": %s' % (what, expected, e))
+
+
+def main(args):
+    check_profiles()
+    check_validate()
+    check_build()
+    check(pacing.pacers == [], 'making the profile specs registered %d pacers' % len(pacing.pacers))
+
+    return checks.report('Pipeline builder checks', '%d profiles' % len(profiles.PROFILES))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
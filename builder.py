@@ -0,0 +1,209 @@
+#
+# A generic Gstreamer pipeline builder (MegaMosquito)
+#
+# Instead of creating, configuring, adding and linking each element by hand
+# (as the original examples do), the pipeline is described by a "spec" (see
+# "profiles.py" for the ones used by deepstream-rtsp.py) and built here. A
+# spec is just a dict:
+#
+#   {
+#     'elements': [
+#       # An element made by a Gstreamer element factory, and its properties
+#       { 'name': 'convertor', 'factory': 'nvvideoconvert',
+#         'properties': { 'nvbuf-memory-type': 3 } },
+#       # An element (e.g., a bin) made by calling a Python function
+#       { 'name': 'source-bin-00', 'make': make_source_bin_0 },
+#       ...
+#     ],
+#     'links': [
+#       # Link two elements (Gstreamer picks the pads) ...
+#       ('primary-inference', 'convertor'),
+#       # ... or name the pads ("element.pad"). Request pads (e.g., the
+#       # "sink_%u" pads of nvstreammux) are requested by their names.
+#       ('source-bin-00', 'Stream-muxer.sink_0'),
+#       ...
+#     ],
+#     'probes': [
+#       # Call a function for every buffer through a pad ("element.pad"),
+#       # optionally with some data for it (the default is 0)
+#       ('convertor.sink', osd_sink_pad_buffer_probe),
+#       ('queue.src', count_buffers, counts),
+#     ],
+#   }
+#
+# Elements are added to the pipeline in the order they are listed, and
+# linked in the order the links are listed. A property whose value is a
+# string, for a property of type GstCaps (e.g., "caps" on a capsfilter),
+# is converted with Gst.Caps.from_string.
+#
+# "validate" checks a spec for mistakes (without needing Gstreamer), and
+# "build" validates it, then builds the pipeline. Both raise ValueError,
+# listing everything that is wrong.
+#
+
+# Split a link or probe endpoint ("element" or "element.pad") into parts
+def _endpoint(text):
+    if '.' in text:
+        element, pad = text.split('.', 1)
+        return element, pad
+    return text, None
+
+
+#
+# Check a spec for mistakes. This doesn't need Gstreamer (so it doesn't
+# know if the factories or properties exist; "build" checks those).
+#
+def validate(spec):
+    errors = []
+    names = set()
+    for e in spec.get('elements', []):
+        name = e.get('name')
+        if not name:
+            errors.append('an element has no name: %s' % e)
+            continue
+        if '.' in name:
+            errors.append('element name "%s" must not contain "."' % name)
+        if name in names:
+            errors.append('element "%s" is listed more than once' % name)
+        names.add(name)
+        if ('factory' in e) == ('make' in e):
+            errors.append('element "%s" must have one of "factory" or "make"' % name)
+        if not isinstance(e.get('properties', {}), dict):
+            errors.append('the properties of element "%s" must be a dict' % name)
+    if not names:
+        errors.append('the spec has no elements')
+
+    # Each pad can only be linked once. Where the pads are not named, an
+    # element can only be linked once in each direction (elements with more
+    # than one pad in a direction, e.g., muxers, need their pads named).
+    graph = {}
+    used = set()
+    linked = set()
+    for link in spec.get('links', []):
+        if len(link) != 2:
+            errors.append('a link must be a pair: %s' % (link,))
+            continue
+        src, src_pad = _endpoint(link[0])
+        sink, sink_pad = _endpoint(link[1])
+        for element in [src, sink]:
+            if element not in names:
+                errors.append('link %s -> %s: there is no element "%s"' % (link[0], link[1], element))
+        if src == sink:
+            errors.append('link %s -> %s: an element can\'t be linked to itself' % (link[0], link[1]))
+        for key in [('src', src, src_pad), ('sink', sink, sink_pad)]:
+            if key in used:
+                errors.append('link %s -> %s: the %s pad of "%s" is already linked' % (link[0], link[1], key[0], key[1]))
+            used.add(key)
+        graph.setdefault(src, set()).add(sink)
+        linked.add(src)
+        linked.add(sink)
+    if len(names) > 1:
+        for name in sorted(names - linked):
+            errors.append('element "%s" is not linked to anything' % name)
+
+    # Data must flow one way, from the sources to the sinks
+    state = {}
+    def visit(name, path):
+        state[name] = 'visiting'
+        for nxt in sorted(graph.get(name, [])):
+            if state.get(nxt) == 'visiting':
+                errors.append('the links form a loop: %s' % ' -> '.join(path + [name, nxt]))
+            elif nxt not in state:
+                visit(nxt, path + [name])
+        state[name] = 'done'
+    for name in sorted(graph):
+        if name not in state:
+            visit(name, [])
+
+    for p in spec.get('probes', []):
+        if len(p) < 2:
+            errors.append('a probe must be ("element.pad", callback) or ("element.pad", callback, data): %s' % (p,))
+            continue
+        element, pad = _endpoint(p[0])
+        if element not in names:
+            errors.append('probe on %s: there is no element "%s"' % (p[0], element))
+        if pad is None:
+            errors.append('probe on %s: the pad must be named ("element.pad")' % p[0])
+        if not callable(p[1]):
+            errors.append('probe on %s: the callback is not callable' % p[0])
+
+    if errors:
+        raise ValueError('invalid pipeline spec:\n  ' + '\n  '.join(errors))
+
+
+# Return the named pad of an element, requesting it if it is a request pad
+def _get_pad(element, name):
+    pad = element.get_static_pad(name)
+    if not pad:
+        pad = element.get_request_pad(name)
+    return pad
+
+
+#
+# Build the pipeline described by a spec. Returns the pipeline, and a dict
+# of its elements (by name).
+#
+def build(spec):
+    # Gstreamer dependency (imported here, so "validate" works without it)
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+
+    validate(spec)
+    errors = []
+    pipeline = Gst.Pipeline()
+    if not pipeline:
+        raise ValueError('unable to create the pipeline')
+
+    # Create and configure the elements, and add them to the pipeline
+    elements = {}
+    for e in spec['elements']:
+        name = e['name']
+        if 'make' in e:
+            element = e['make']()
+        else:
+            element = Gst.ElementFactory.make(e['factory'], name)
+        if not element:
+            errors.append('unable to create element "%s" (%s)' % (name, e.get('factory', 'make')))
+            continue
+        for prop, value in e.get('properties', {}).items():
+            pspec = element.find_property(prop)
+            if pspec is None:
+                errors.append('element "%s" (%s) has no property "%s"' % (name, e.get('factory', 'make'), prop))
+                continue
+            if isinstance(value, str) and pspec.value_type == Gst.Caps.__gtype__:
+                value = Gst.Caps.from_string(value)
+            element.set_property(prop, value)
+        pipeline.add(element)
+        elements[name] = element
+    if errors:
+        raise ValueError('unable to build pipeline:\n  ' + '\n  '.join(errors))
+
+    # Link them together
+    for link in spec.get('links', []):
+        src, src_pad = _endpoint(link[0])
+        sink, sink_pad = _endpoint(link[1])
+        if src_pad is None and sink_pad is None:
+            ok = elements[src].link(elements[sink])
+        else:
+            ok = elements[src].link_pads(src_pad, elements[sink], sink_pad)
+            if not ok and src_pad is not None and sink_pad is not None:
+                # Request pads may need to be requested by name first
+                a = _get_pad(elements[src], src_pad)
+                b = _get_pad(elements[sink], sink_pad)
+                ok = a is not None and b is not None and a.link(b) == Gst.PadLinkReturn.OK
+        if not ok:
+            errors.append('unable to link %s -> %s' % (link[0], link[1]))
+
+    # Attach the probes
+    for p in spec.get('probes', []):
+        element, pad_name = _endpoint(p[0])
+        pad = elements[element].get_static_pad(pad_name)
+        if not pad:
+            errors.append('probe on %s: there is no such pad' % p[0])
+            continue
+        pad.add_probe(Gst.PadProbeType.BUFFER, p[1], p[2] if len(p) > 2 else 0)
+
+    if errors:
+        raise ValueError('unable to build pipeline:\n  ' + '\n  '.join(errors))
+    return pipeline, elements
@@ -0,0 +1,38 @@
+#
+# The CPU check scripts (MegaMosquito)
+#
+# Each "*-test.py" check script (e.g., roi-test.py, pacing-test.py) checks
+# one part of the pipeline without a GPU or Deepstream, so they can all be
+# run in CI on ordinary machines. They share this: each one calls "check"
+# for everything it checks, and ends with "report", which prints what
+# failed, and a summary, and returns the script's exit status (0 if all of
+# the checks passed), e.g.:
+#
+#    import checks
+#    ...
+#    checks.check(len(boxes) == 20, 'only %d boxes' % len(boxes))
+#    ...
+#    sys.exit(checks.report('Box checks', '%d boxes' % len(boxes)))
+#
+
+
+# The messages for the checks that have failed so far
+failures = []
+
+
+# Record a failure, with "message", if "ok" is not true
+def check(ok, message):
+    if not ok:
+        failures.append(message)
+
+
+# Print the failures, and a summary (with "details", if given, in it), and
+# return the exit status: 1 if anything failed, otherwise 0
+def report(title, details=None):
+    for f in failures:
+        print('FAIL: %s' % f)
+    counts = '%d failures' % len(failures)
+    if details:
+        counts = '%s, %s' % (details, counts)
+    print('%s: %s (%s)' % (title, 'FAILED' if failures else 'PASSED', counts))
+    return 1 if failures else 0
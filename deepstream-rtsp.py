@@ -66,18 +66,16 @@ CONFIG_FILE = 'deepstream-rtsp.cfg'
 
 # Basic dependencies
 import os
+import sys
 import time
-import math
 
 
 # Additional configuration is pulled from the process environment, if these
 # variables are present. In some cases default values are provided to enable
 # users to not have to set these if they just want to use standard values.
-def get_from_env(v, d):
-  if v in os.environ and '' != os.environ[v]:
-    return os.environ[v]
-  else:
-    return d
+# (See "environment.py", which is next to this file.)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from environment import get_from_env
 CODEC = get_from_env('CODEC', 'H264') # Could also be 'H265'
 BITRATE = get_from_env('BITRATE', '4000000')
 RTSPINPUT = get_from_env('RTSPINPUT', '') # No default, so it's *REQUIRED*
@@ -88,6 +86,24 @@ IPADDR = get_from_env('IPADDR', '<IPADDRESS>') # host LAN IP, if given
 SHOW_FRAMES = 'no' != get_from_env('SHOW_FRAMES', 'yes') # Default is to show
 OUTPUT_WIDTH = int(get_from_env('OUTPUT_WIDTH', '1200')) # Output video width
 OUTPUT_HEIGHT = int(get_from_env('OUTPUT_HEIGHT', '600')) # Output video height
+OUTPUT_SYNC = int(get_from_env('OUTPUT_SYNC', '0')) # See "sync" on the sink below
+OUTPUT_QUEUE = int(get_from_env('OUTPUT_QUEUE', '0')) # Encoder queue (0 = none)
+PRESET_LEVEL = int(get_from_env('PRESET_LEVEL', '1')) # Encoder preset (Jetson)
+SYNTHETIC_WIDTH = int(get_from_env('SYNTHETIC_WIDTH', '1280')) # See "synthetic://"
+SYNTHETIC_HEIGHT = int(get_from_env('SYNTHETIC_HEIGHT', '720'))
+SYNTHETIC_FPS = int(get_from_env('SYNTHETIC_FPS', '30'))
+SOAK_SECONDS = int(get_from_env('SOAK_SECONDS', '0')) # Soak test length (0 = off)
+SOAK_INTERVAL = int(get_from_env('SOAK_INTERVAL', '60')) # Seconds between samples
+SECONDARY_INFERENCE = get_from_env('SECONDARY_INFERENCE', '') # Stage names (default none)
+SECONDARY_CONFIG_FILE = get_from_env('SECONDARY_CONFIG_FILE', 'secondary-inference.cfg')
+TRACKER_LIB = get_from_env('TRACKER_LIB', '/opt/nvidia/deepstream/deepstream-5.0/lib/libnvds_mot_klt.so')
+PIPELINE_PROFILE = get_from_env('PIPELINE_PROFILE', 'full') # See "profiles.py"
+SOFTWARE_ENCODER = 'yes' == get_from_env('SOFTWARE_ENCODER', 'no') # Default is hardware
+OUTPUT_PACING = 'yes' == get_from_env('OUTPUT_PACING', 'no') # See "pacing.py"
+PACING_MIN_DELAY_MS = int(get_from_env('PACING_MIN_DELAY_MS', '20'))
+PACING_MAX_DELAY_MS = int(get_from_env('PACING_MAX_DELAY_MS', '200'))
+PACING_REPORT = int(get_from_env('PACING_REPORT', '60')) # Seconds between reports (0 = none)
+ROI = get_from_env('ROI', '') # Regions of interest, see "roi.py" (default none)
 
 RTSP_INPUTS = RTSPINPUT.split(',')
 
@@ -95,7 +111,6 @@ RTSP_INPUTS = RTSPINPUT.split(',')
 # directory, which is inconvenient and error-prone. So I am explicitly
 # manipulating the search path here to remove the working directory
 # dependency:
-import sys
 # Oddly the python3 lib is not on the search path, so add that first
 sys.path.append('/usr/lib/python3.6')
 if 'arm64' == ARCH or 'aarch64' == ARCH:
@@ -116,6 +131,12 @@ sys.path.append('.')
 # I switched the example to use standard temp files
 import tempfile
 
+# Time stamping for the synthetic sources (see "latency.py")
+import latency
+
+# Soak test monitoring (see "soak.py")
+import soak
+
 # Gstreamer dependency
 import gi
 gi.require_version('Gst', '1.0')
@@ -127,6 +148,27 @@ from common.bus_call import bus_call
 # Import the NVIDIA Deepstream Python bindings
 import pyds
 
+# The metadata probe (see "osd_sink_pad_buffer_probe" below)
+import probe
+probe.show_frames = SHOW_FRAMES
+
+# Optional exports of the probe's results (see "exports.py")
+import exports
+
+# Optional secondary inference stages (see "secondary.py")
+import secondary
+
+# The pipeline profiles, and the builder that builds them (see "profiles.py"
+# and "builder.py")
+import profiles
+import builder
+
+# Optional output pacing (see "pacing.py")
+import pacing
+
+# Optional per-source regions of interest (see "roi.py")
+import roi
+
 
 
 
@@ -140,7 +182,7 @@ import pyds
 # This code comes from:
 #    /opt/nvidia/deepstream/deepstream-5.0/sources/python/apps/deepstream-imagedata-multistream
 #
-def cb_newpad(decodebin, decoder_src_pad, data):
+def cb_newpad(decodebin, decoder_src_pad, data, source_roi=None):
     debug("In cb_newpad")
     caps=decoder_src_pad.get_current_caps()
     gststruct=caps.get_structure(0)
@@ -155,6 +197,20 @@ def cb_newpad(decodebin, decoder_src_pad, data):
         # decoder plugin nvdec_*. We do this by checking if the pad caps contain
         # NVMM memory features.
         if features.contains("memory:NVMM"):
+            if source_roi is not None:
+                # Now that the frame size is known, set up the convertor to
+                # keep only the region of interest, in its place, and feed
+                # the decoder into it (see "roi.py"). The ghost pad already
+                # targets the convertor.
+                crop=source_bin.get_by_name("roi-crop")
+                rect = source_roi.crop(gststruct.get_value("width"), gststruct.get_value("height"))
+                crop.set_property("src-crop", roi.src_crop(rect))
+                crop.set_property("dest-crop", roi.src_crop(rect))
+                debug("Keeping only %s (src-crop and dest-crop %s)" % (source_roi, crop.get_property("src-crop")))
+                if decoder_src_pad.link(crop.get_static_pad("sink")) != Gst.PadLinkReturn.OK:
+                    sys.stderr.write("ERROR: Failed to link decoder src pad to region of interest crop\n")
+                    sys.exit(1)
+                return
             # Get the source bin ghost pad
             bin_ghost_pad=source_bin.get_static_pad("src")
             if not bin_ghost_pad.set_target(decoder_src_pad):
@@ -170,7 +226,7 @@ def decodebin_child_added(child_proxy,Object,name,user_data):
     if(is_aarch64() and name.find("nvv4l2decoder") != -1):
         debug("Seting bufapi_version")
         Object.set_property("bufapi-version",True)
-def create_source_bin(index,uri):
+def create_source_bin(index,uri,source_roi=None):
     debug("Creating source bin")
 
     # Create a source GstBin to abstract this bin's content from the rest of the
@@ -193,7 +249,7 @@ def create_source_bin(index,uri):
     uri_decode_bin.set_property("uri",uri)
     # Connect to the "pad-added" signal of the decodebin which generates a
     # callback once a new pad for raw data has beed created by the decodebin
-    uri_decode_bin.connect("pad-added",cb_newpad,nbin)
+    uri_decode_bin.connect("pad-added",cb_newpad,nbin,source_roi)
     uri_decode_bin.connect("child-added",decodebin_child_added,nbin)
 
     # We need to create a ghost pad for the source bin which will act as a proxy
@@ -202,7 +258,22 @@ def create_source_bin(index,uri):
     # cb_newpad callback, we will set the ghost pad target to the video decoder
     # src pad.
     Gst.Bin.add(nbin,uri_decode_bin)
-    bin_pad=nbin.add_pad(Gst.GhostPad.new_no_target("src",Gst.PadDirection.SRC))
+    if source_roi is not None:
+        # With a region of interest, the decoder feeds a convertor that
+        # blanks out the rest of the frames (on the GPU), and the ghost pad is
+        # the convertor's output instead. The convertor's frames are the same
+        # size as the decoder's. The crop itself is set in cb_newpad (see
+        # "roi.py").
+        crop=Gst.ElementFactory.make("nvvideoconvert", "roi-crop")
+        if not crop:
+            sys.stderr.write("ERROR: Unable to create region of interest crop")
+            sys.exit(1)
+        if not is_aarch64():
+            crop.set_property("nvbuf-memory-type", int(pyds.NVBUF_MEM_CUDA_UNIFIED))
+        Gst.Bin.add(nbin,crop)
+        bin_pad=nbin.add_pad(Gst.GhostPad.new("src",crop.get_static_pad("src")))
+    else:
+        bin_pad=nbin.add_pad(Gst.GhostPad.new_no_target("src",Gst.PadDirection.SRC))
     if not bin_pad:
         sys.stderr.write("ERROR: Failed to add ghost pad in source bin")
         sys.exit(1)
@@ -213,19 +284,110 @@ def create_source_bin(index,uri):
 
 
 #
-# This is the "PGIE" inferencing example from the original NVIDIA Deepstream
-# example in 
+# This is a synthetic source, used in place of an RTSP input stream when the
+# input URI is "synthetic://". It needs no camera, and no network, so the
+# whole pipeline can be exercised on localhost (e.g., by latency-test.py).
 #
-# This example detects these classes:
-#  - normal vehicles (cars, trucks, busses)
-#  - 2-wheeled vehicles (bicycles, mopeds, motorcycles)
-#  - people
-#  - road signs
+# Every frame is a plain grey picture with the wall clock time at which it
+# was created painted into it as a barcode (see "latency.py" for details).
+# The frames are created in Python, at SYNTHETIC_FPS, SYNTHETIC_WIDTH by
+# SYNTHETIC_HEIGHT, and pushed into the pipeline through an "appsrc"
+# element. They are then copied into NVMM memory (which is what the
+# streammux element requires) by an nvvideoconvert element:
 #
-PGIE_CLASS_ID_VEHICLE = 0
-PGIE_CLASS_ID_BICYCLE = 1
-PGIE_CLASS_ID_PERSON = 2
-PGIE_CLASS_ID_ROADSIGN = 3
+#   +-------------------------------------------------------------+
+#   | appsrc (I420) --> nvvideoconvert --> capsfilter (NVMM) -->  src
+#   +-------------------------------------------------------------+
+#
+# If the source has a region of interest (see "roi.py") the rest of the
+# frames is blanked out (on the CPU, by a videocrop element, and a videobox
+# element to put the borders back) before they are copied. Note that this
+# may blank out the time stamp, which is painted along the bottom of the
+# frame, so don't set one for latency tests.
+#
+def synthetic_need_data(appsrc, length, state):
+    # Wait until it is time for the next frame (appsrc asks for data as soon
+    # as it has room for more, which would otherwise run much too fast)
+    now = time.time()
+    if state['next'] > now:
+        time.sleep(state['next'] - now)
+    state['next'] = max(state['next'], now) + 1.0 / SYNTHETIC_FPS
+
+    # Stamp a copy of the blank frame with the current time, and push it
+    frame = bytearray(state['blank'])
+    latency.paint_stamp(frame, SYNTHETIC_WIDTH, SYNTHETIC_HEIGHT, latency.time_to_stamp(time.time()))
+    appsrc.emit("push-buffer", Gst.Buffer.new_wrapped(bytes(frame)))
+def create_synthetic_source_bin(index,source_roi=None):
+    debug("Creating synthetic source bin")
+
+    bin_name="source-bin-%02d" %index
+    debug(bin_name)
+    nbin=Gst.Bin.new(bin_name)
+    if not nbin:
+        sys.stderr.write("ERROR: Unable to create synthetic source bin")
+        sys.exit(1)
+
+    # The frame source. Timestamps are added by appsrc as buffers arrive.
+    appsrc=Gst.ElementFactory.make("appsrc", "synthetic-source")
+    if not appsrc:
+        sys.stderr.write("ERROR: Unable to create synthetic source")
+        sys.exit(1)
+    appsrc.set_property("caps", Gst.Caps.from_string("video/x-raw, format=I420, width=%d, height=%d, framerate=%d/1" % (SYNTHETIC_WIDTH, SYNTHETIC_HEIGHT, SYNTHETIC_FPS)))
+    appsrc.set_property("format", Gst.Format.TIME)
+    appsrc.set_property("is-live", True)
+    appsrc.set_property("do-timestamp", True)
+    # A blank (mid-grey) I420 frame to copy and stamp for each output frame
+    y_size = SYNTHETIC_WIDTH * SYNTHETIC_HEIGHT
+    state = {
+        'blank': bytes([128]) * (y_size + 2 * (y_size // 4)),
+        'next': 0.0
+    }
+    appsrc.connect("need-data", synthetic_need_data, state)
+
+    # Copy the frames into NVMM memory for the streammux element
+    convertor=Gst.ElementFactory.make("nvvideoconvert", "synthetic-convertor")
+    if not convertor:
+        sys.stderr.write("ERROR: Unable to create synthetic source convertor")
+        sys.exit(1)
+    nvmm=Gst.ElementFactory.make("capsfilter", "synthetic-caps")
+    if not nvmm:
+        sys.stderr.write("ERROR: Unable to create synthetic source caps filter")
+        sys.exit(1)
+    nvmm.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=NV12"))
+
+    Gst.Bin.add(nbin,appsrc)
+    Gst.Bin.add(nbin,convertor)
+    Gst.Bin.add(nbin,nvmm)
+    if source_roi is not None:
+        # Keep only the region of interest, in its place in the frame
+        crop=Gst.ElementFactory.make("videocrop", "roi-crop")
+        if not crop:
+            sys.stderr.write("ERROR: Unable to create synthetic source region of interest crop")
+            sys.exit(1)
+        box=Gst.ElementFactory.make("videobox", "roi-box")
+        if not box:
+            sys.stderr.write("ERROR: Unable to create synthetic source region of interest box")
+            sys.exit(1)
+        rect = source_roi.crop(SYNTHETIC_WIDTH, SYNTHETIC_HEIGHT)
+        for prop, value in roi.videocrop(rect, SYNTHETIC_WIDTH, SYNTHETIC_HEIGHT).items():
+            crop.set_property(prop, value)
+        for prop, value in roi.videobox(rect, SYNTHETIC_WIDTH, SYNTHETIC_HEIGHT).items():
+            box.set_property(prop, value)
+        Gst.Bin.add(nbin,crop)
+        Gst.Bin.add(nbin,box)
+        appsrc.link(crop)
+        crop.link(box)
+        box.link(convertor)
+    else:
+        appsrc.link(convertor)
+    convertor.link(nvmm)
+
+    # Expose the caps filter output as the source pad of this bin
+    bin_pad=nbin.add_pad(Gst.GhostPad.new("src",nvmm.get_static_pad("src")))
+    if not bin_pad:
+        sys.stderr.write("ERROR: Failed to add ghost pad in synthetic source bin")
+        sys.exit(1)
+    return nbin
 
 
 
@@ -240,17 +402,11 @@ PGIE_CLASS_ID_ROADSIGN = 3
 # video frames). This is a good place to probe because all the information
 # about the objects detected must be available here.
 #
+# The work of walking through the metadata for each frame (counting the
+# objects, and adding the text that is drawn on the frame) is done by
+# "process_batch" in "probe.py". See that file for details.
+#
 def osd_sink_pad_buffer_probe(pad,info,u_data):
-    frame_number=0
-    #Intiallizing object counter with 0.
-    obj_counter = {
-        PGIE_CLASS_ID_VEHICLE:0,
-        PGIE_CLASS_ID_PERSON:0,
-        PGIE_CLASS_ID_BICYCLE:0,
-        PGIE_CLASS_ID_ROADSIGN:0
-    }
-    num_rects=0
-
     gst_buffer = info.get_buffer()
     if not gst_buffer:
         debug("Unable to get GstBuffer ")
@@ -260,74 +416,73 @@ def osd_sink_pad_buffer_probe(pad,info,u_data):
     # Note that pyds.gst_buffer_get_nvds_batch_meta() expects the
     # C address of gst_buffer as input, which is obtained with hash(gst_buffer)
     batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
-    l_frame = batch_meta.frame_meta_list
-    while l_frame is not None:
-        try:
-            # Note that l_frame.data needs a cast to pyds.NvDsFrameMeta
-            # The casting is done by pyds.NvDsFrameMeta.cast()
-            # The casting also keeps ownership of the underlying memory
-            # in the C code, so the Python garbage collector will leave
-            # it alone.
-            frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
-        except StopIteration:
-            break
-
-        frame_number=frame_meta.frame_num
-        num_rects = frame_meta.num_obj_meta
-        l_obj=frame_meta.obj_meta_list
-        while l_obj is not None:
-            try:
-                # Casting l_obj.data to pyds.NvDsObjectMeta
-                obj_meta=pyds.NvDsObjectMeta.cast(l_obj.data)
-            except StopIteration:
-                break
-            obj_counter[obj_meta.class_id] += 1
-            try: 
-                l_obj=l_obj.next
-            except StopIteration:
-                break
-
-        # Acquiring a display meta object. The memory ownership remains in
-        # the C code so downstream plugins can still access it. Otherwise
-        # the garbage collector will claim it when this probe function exits.
-        display_meta=pyds.nvds_acquire_display_meta_from_pool(batch_meta)
-        display_meta.num_labels = 1
-        py_nvosd_text_params = display_meta.text_params[0]
-        # Setting display text to be shown on screen
-        # Note that the pyds module allocates a buffer for the string, and the
-        # memory will not be claimed by the garbage collector.
-        # Reading the display_text field here will return the C address of the
-        # allocated string. Use pyds.get_string() to get the string content.
-        py_nvosd_text_params.display_text = "Frame={}  Objects={}  Vehicles={}  Cycles={}  Persons={}  Signs={}".format(frame_number, num_rects, obj_counter[PGIE_CLASS_ID_VEHICLE], obj_counter[PGIE_CLASS_ID_BICYCLE], obj_counter[PGIE_CLASS_ID_PERSON], obj_counter[PGIE_CLASS_ID_ROADSIGN])
-
-        # Now set the offsets where the string should appear
-        py_nvosd_text_params.x_offset = 10
-        py_nvosd_text_params.y_offset = 12
-
-        # Font , font-color and font-size
-        py_nvosd_text_params.font_params.font_name = "Serif"
-        py_nvosd_text_params.font_params.font_size = 10
-        # set(red, green, blue, alpha); set to White
-        py_nvosd_text_params.font_params.font_color.set(1.0, 1.0, 1.0, 1.0)
-
-        # Text background color
-        py_nvosd_text_params.set_bg_clr = 1
-        # set(red, green, blue, alpha); set to Black
-        py_nvosd_text_params.text_bg_clr.set(0.0, 0.0, 0.0, 1.0)
-        # Using pyds.get_string() to get display_text as string
-        if SHOW_FRAMES:
-            print(pyds.get_string(py_nvosd_text_params.display_text))
-        pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
-        try:
-            l_frame=l_frame.next
-        except StopIteration:
-            break
+    probe.process_batch(batch_meta)
 			
     return Gst.PadProbeReturn.OK	
 
 
 
 
+#
+# These are the callback functions for the output pacing probes (when
+# OUTPUT_PACING is set). They are attached to the sink (input) and source
+# (output) pads of the queue after the encoder. The first notes when each
+# frame arrives at the queue, and the second holds each frame as it leaves
+# the queue until it is time to send it, or drops it if it is too late. The
+# timing decisions are made by the Pacer (see "pacing.py" for details).
+#
+def pacing_arrival_probe(pad,info,pacer):
+    pacer.arrive(time.monotonic())
+    return Gst.PadProbeReturn.OK
+def pacing_release_probe(pad,info,pacer):
+    gst_buffer = info.get_buffer()
+    if not gst_buffer:
+        debug("Unable to get GstBuffer ")
+        return Gst.PadProbeReturn.OK
+
+    pts = None if gst_buffer.pts == Gst.CLOCK_TIME_NONE else gst_buffer.pts / float(Gst.SECOND)
+    keyframe = not gst_buffer.has_flags(Gst.BufferFlags.DELTA_UNIT)
+    wait, request_keyframe = pacer.depart(pts, keyframe, time.monotonic())
+
+    # Frames have been dropped, so ask the encoder (upstream of the queue)
+    # for a keyframe, to get the viewers' decoders going again
+    if request_keyframe:
+        debug("Pacing %s: requesting a keyframe" % pacer.name)
+        event = Gst.Event.new_custom(Gst.EventType.CUSTOM_UPSTREAM, Gst.Structure.new_from_string("GstForceKeyUnit, all-headers=(boolean)true, count=(uint)0"))
+        pad.get_parent_element().get_static_pad("sink").push_event(event)
+
+    if wait is None:
+        return Gst.PadProbeReturn.DROP
+    if wait > 0:
+        time.sleep(wait)
+    # The jitter is measured from when the frame really goes, after the sleep
+    pacer.released(time.monotonic())
+    return Gst.PadProbeReturn.OK
+
+# Print the pacing counts (every PACING_REPORT seconds, from the event loop)
+def pacing_report():
+    for r in pacing.report():
+        print('Pacing %s: %.2f fps, delay %.1fms, jitter %.1fms, %d sent, %d dropped late, %d dropped waiting for a keyframe (%d bursts)' % (r['name'], r['fps'], r['delay_ms'], r['jitter_ms'], r['sent'], r['dropped_late'], r['dropped_resync'], r['drop_bursts']))
+    return True
+
+
+
+
+#
+# When a soak test is running (SOAK_SECONDS is set) this is called every
+# SOAK_INTERVAL seconds from the main event loop to take a sample. It stops
+# the event loop when the test fails, or when it has run long enough. See
+# "soak.py" for details.
+#
+def soak_sample(monitor, loop):
+    if not monitor.sample() or time.time() - monitor.start >= SOAK_SECONDS:
+        loop.quit()
+        return False
+    return True
+
+
+
+
 ##############################################################################
 # The main program
 ##############################################################################
@@ -375,36 +530,43 @@ def osd_sink_pad_buffer_probe(pad,info,u_data):
 # perform the opposite function converting a single input on their
 # only sink pad into multiple outputs on their source pads.
 #
-# In general elements are created with:
-#    elementX = Gst.ElementFactory.make( ... )
-# The resullt of that must be checked, e.g.:
-#    if not elementX: sys.exit(1)
-# Elements are often configured with:
-#    elementX.set_property('property-name-goes-here', 'value goes here')
-# When ready, elements are added to the pipeline:
-#    pipeline.add(elementX)
-# If the source pad of a previous element (elementQ here) needs to
-# be linked to the sink pad of your element (elementX here) you can
-# use the link function, like this:
-#    elementQ.link(elementX)
-# The result will flow data from elementQ to elementX:
-#    elementQ -> elementX
-#    
-# NOTE: for the initial "source element" and the final "sink element", I
-# have provided commented-out alternatives (e.g., file input, screen output,
-# and no output (the "fake" sink). There is also a "fake" source available
-# but I am not sure what use that has.
+# The original examples create, configure, add and link each element by
+# hand, one after the other. Here, the pipeline is described instead, as a
+# list of elements (with their properties), and a list of the links between
+# them, and then built from that description by "builder.py". There are a
+# few different pipelines to choose from (see PIPELINE_PROFILE), described
+# in "profiles.py", where you will also find the details of what each of
+# the elements does:
+#
+#   full            (the default) tile all of the inputs into one video,
+#                   draw the boxes, and serve it as one RTSP output stream
+#   metadata-only   just do the inferencing (for the probe, and the
+#                   exports hooked into it), with no video output at all
+#   per-camera      draw the boxes on each input, and serve each one as its
+#                   own RTSP output stream
+#
+# To change the pipeline (e.g., to add or remove elements) edit a profile,
+# or write a new one. The source bins (see "create_source_bin" above) and
+# the probe (see "osd_sink_pad_buffer_probe" above) are passed to the
+# profiles, along with the configuration from the environment.
 #
 
 def main(args):
 
+    # Check the profile name before anything else
+    if PIPELINE_PROFILE not in profiles.PROFILES:
+        sys.stderr.write('ERROR: Unknown PIPELINE_PROFILE, "%s" (use one of: %s).\n' % (PIPELINE_PROFILE, ', '.join(sorted(profiles.PROFILES))))
+        sys.exit(1)
+
     # Announce some useful info at startup
     print('\n\n\n\n')
-    print('Using codec: %s, and bitrate: %s' % (CODEC, BITRATE))
+    print('Using pipeline profile: %s' % PIPELINE_PROFILE)
+    print('Using codec: %s, and bitrate: %s%s' % (CODEC, BITRATE, ' (software encoder)' if SOFTWARE_ENCODER else ''))
+    if OUTPUT_PACING:
+        print('Output pacing: on (delay %d to %dms)' % (PACING_MIN_DELAY_MS, PACING_MAX_DELAY_MS))
     print('RTSP input streams (%d):' % (len(RTSP_INPUTS)))
     for i in range(len(RTSP_INPUTS)):
         print('  %d: "%s"' % (i, RTSP_INPUTS[i]))
-    print('RTSP output stream: "rtsp://%s:%s%s"' % (IPADDR, RTSPOUTPUTPORTNUM, RTSPOUTPUTPATH))
     print('\n\n\n\n')
 
     time.sleep(5)
@@ -412,373 +574,111 @@ def main(args):
     GObject.threads_init()
     Gst.init(None)
 
-    # Create the GStreamer pipeline object that will connect the elements
-    debug("Creating Pipeline ")
-    pipeline = Gst.Pipeline()
-    if not pipeline:
-        sys.stderr.write("ERROR: Unable to create Pipeline\n")
-        sys.exit(1)
-    
 
     #########################################################################
-    # The first "source element" in the pipeline is a "bin" element
+    # Gather up everything the pipeline profile needs
     #########################################################################
 
-    # NOTE: An alternate option here could be a file as an input source:
-    #debug("Creating an element that uses a file as an input source")
-    #source = Gst.ElementFactory.make("filesrc", "file-source")
-    #if not source:
-    #    sys.stderr.write("ERROR: Unable to create file input element!\n")
-    #    sys.exit(1)
-    
-    # In this example I am using a list of one or more RTSP streams for input.
-    # The code for this is mostly within these 3 functions above:
-    #     def cb_newpad(decodebin, decoder_src_pad,data):
-    #     def decodebin_child_added(child_proxy,Object,name,user_data):
-    #     def create_source_bin(index,uri):
-    # All of these functions were taken from this NVIDIA Deepstream example:
-    #   /opt/nvidia/deepstream/deepstream-5.0/sources/python/apps/deepstream-imagedata-multistream
-    # This element consumes RTSP streams "live", and multiplexes them
-    # together before passing the *combined* stream on to the next element
-    # in the pipeline. Each of these input RTSP streams is added to the
-    # pipeline as a "bin", and all of them are linked to the streammux
-    # element, something like this:
-    #
-    #  +-------------+   +-------------------+
-    #  | stream0-bin +-->|sink-pad           |
-    #  +-------------+   |                   |
-    #                    |                   |
-    #  +-------------+   |                   |
-    #  | stream1-bin +-->|sink-pad           |   +--------------+
-    #  +-------------+   |                   +-->| next-element +--> ...
-    #                    | streammux-element |   +--------------+
-    #         ...        |                   |
-    #                    |                   |
-    #  +-------------+   |                   |
-    #  | streamN-bin +-->|sink-pad           |
-    #  +-------------+   +-------------------+
-    #
-
-    # Multiplexing element with bins to read from multiple RTSP input streams
-    debug("Creating elements to receive RTSP streams as the video input")
-
-    # Create nvstreammux instance to form batches from one or more sources.
-    streammux = Gst.ElementFactory.make("nvstreammux", "Stream-muxer")
-    if not streammux:
-        sys.stderr.write("ERROR: Unable to create NvStreamMux\n")
-        sys.exit(1)
-    streammux.set_property('width', 1920)
-    streammux.set_property('height', 1080)
-    streammux.set_property('batch-size', 1)
-    streammux.set_property('batched-push-timeout', 4000000)
-
-    # Add streammux to the pipeline
-    pipeline.add(streammux)
+    # All of the sources are scaled to this size by the streammux element
+    MUX_WIDTH = 1920
+    MUX_HEIGHT = 1080
 
-    # Initialization
-    parent_folder_name = tempfile.mkdtemp()
-    frame_count = {}
-    saved_count = {}
+    # The regions of interest (if any) for the sources. Only these parts of
+    # their frames are inferenced. See "roi.py" for details.
+    try:
+        rois = roi.parse(ROI, len(RTSP_INPUTS), MUX_WIDTH, MUX_HEIGHT)
+    except ValueError as e:
+        sys.stderr.write("ERROR: %s\n" % e)
+        sys.exit(1)
+    for i in sorted(rois):
+        print('Region of interest for input %d: left=%d, top=%d, width=%d, height=%d' % (i, rois[i].left, rois[i].top, rois[i].width, rois[i].height))
 
-    # Loop through the provided RTSP input sources
+    # One function per input, to make its source bin (for "synthetic://"
+    # inputs, a synthetic source bin, otherwise an RTSP stream source bin)
+    sources = []
     for i in range(len(RTSP_INPUTS)):
-
         name = RTSP_INPUTS[i]
-        debug("--> input #%d: %s" % (i, name))
-
-        # Init for this stream
-        os.mkdir(parent_folder_name+"/stream_"+str(i))
-        frame_count["stream_"+str(i)]=0
-        saved_count["stream_"+str(i)]=0
-        if name.find("rtsp://") == 0 :
-            is_live = True
-
-        # Create the bin for this stream, and make a source pad for its output
-        source_bin=create_source_bin(i, name)
-        if not source_bin:
-            sys.stderr.write("ERROR: Unable to create source bin \n")
-            sys.exit(1)
-        srcpad=source_bin.get_static_pad("src")
-        if not srcpad:
-            sys.stderr.write("ERROR: Unable to create src pad bin \n")
-            sys.exit(1)
-
-        # Add this bin to the pipeline
-        pipeline.add(source_bin)
-
-        # Get a sink pad in the streammux element
-        padname="sink_%u" %i
-        sinkpad= streammux.get_request_pad(padname)
-        if not sinkpad:
-            sys.stderr.write("ERROR: Unable to create sink pad bin \n")
-            sys.exit(1)
-
-        # Link the source pad on this bin to the sink pad in streammux
-        srcpad.link(sinkpad)
-
-    debug("All input source elements have been added to the pipeline")
-
-
-
-
-
-    #########################################################################
-    # The next element in the pipeline does the inferencing (on the GPU)
-    #########################################################################
-    
-    debug("Creating an element to do inferencing (PGIE, nvinfer)")
-
-    # Use nvinfer to run inferencing on decoder's output,
-    pgie = Gst.ElementFactory.make("nvinfer", "primary-inference")
-    if not pgie:
-        sys.stderr.write("ERROR: Unable to create pgie\n")
-        sys.exit(1)
-
-    # The configuration for the inferencing comes from the CONFIG_FILE.
-    # See "CONFIG_FILE" above for details
-    pgie.set_property('config-file-path', CONFIG_FILE)
-
-    # Add PGIE to the pipeline, then link streammuux to its input
-    pipeline.add(pgie)
-    streammux.link(pgie)
-    debug("The PGIE element has been added to the pipeline, and linked")
-    
-
-
-
-
-    #########################################################################
-    # The next element in the pipeline converts the output to RGBA format
-    #########################################################################
-
-    debug("Creating an element that converts output video to RGBA format")
-
-    # Use convertor to convert from NV12 to RGBA as required by nvosd
-    nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "convertor")
-    if not nvvidconv:
-        sys.stderr.write("ERROR: Unable to create nvvidconv\n")
-        sys.exit(1)
-    
-    # Add the convertor to the pipeline, then link pgie to its input
-    pipeline.add(nvvidconv)
-    pgie.link(nvvidconv)
-    debug("The convertor element has been added to the pipeline, and linked")
-
-
-
-
-
-
-    #########################################################################
-    # At this point in the pipeline, add a "probe" on the `nvvidconv` input
-    #########################################################################
-
-    debug("Creating a probe to view the inferencing metadata")
-
-    # This probe will consume the meta data generated by nvinfer
-    # and provide it to OSD later.
-    # The probe is added to the sink pad of the OSD element that
-    # follows nvinfer (so it has all object detection metadata).
-    # That element is nvvidconv:
-    followingsinkpad = nvvidconv.get_static_pad("sink")
-    if not followingsinkpad:
-        sys.stderr.write("ERROR: Unable to get sink pad of nvosd\n")
-        sys.exit(1)
-    # Attach a callback function to receive the data from this probe
-    # The probe's callback function displays in the terminal the object
-    # detection results metadata for each frame.
-    # See the "osd_sink_pad_buffer_probe" function definition above for
-    # details on how the probe receives the data and what it does with it.
-    followingsinkpad.add_probe(Gst.PadProbeType.BUFFER, osd_sink_pad_buffer_probe, 0)
-    
-
-
-
-
-
-    #########################################################################
-    # Next element de-multiplexes the input streams into tiles in one stream
-    #########################################################################
-
-    debug("Creating an element to demultiplex the videos into tiles")
-
-    number_of_sources = len(RTSP_INPUTS)
-    tiler=Gst.ElementFactory.make("nvmultistreamtiler", "nvtiler")
-    if not tiler:
-        sys.stderr.write(" Unable to create tiler \n")
-    tiler_rows=int(math.sqrt(number_of_sources))
-    tiler_columns=int(math.ceil((1.0*number_of_sources)/tiler_rows))
-    tiler.set_property("rows",tiler_rows)
-    tiler.set_property("columns",tiler_columns)
-    tiler.set_property("width", OUTPUT_WIDTH)
-    tiler.set_property("height",OUTPUT_HEIGHT)
-    if not is_aarch64():
-        # Use CUDA unified memory in the pipeline so frames
-        # can be easily accessed on CPU in Python.
-        mem_type = int(pyds.NVBUF_MEM_CUDA_UNIFIED)
-        streammux.set_property("nvbuf-memory-type", mem_type)
-        nvvidconv.set_property("nvbuf-memory-type", mem_type)
-        tiler.set_property("nvbuf-memory-type", mem_type)
-    pipeline.add(tiler)
-    nvvidconv.link(tiler)
-    debug("The demultiplexing/tiling element was added and linked")
-
-
-
-
-
-
-    #########################################################################
-    # The next element in the pipeline draws boxes (requires RGBA input)
-    #########################################################################
-
-    debug("Creating elements that draw boxes in the output video")
-
-    # Create OSD to draw on the converted RGBA buffer
-    nvosd = Gst.ElementFactory.make("nvdsosd", "onscreendisplay")
-    if not nvosd:
-        sys.stderr.write("ERROR: Unable to create nvosd\n")
-        sys.exit(1)
-    nvvidconv_postosd = Gst.ElementFactory.make("nvvideoconvert", "convertor_postosd")
-    if not nvvidconv_postosd:
-        sys.stderr.write("ERROR: Unable to create nvvidconv_postosd\n")
-        sys.exit(1)
-    
-    # Add the two OSD elements to the pipeline, then link them togther and to the convertor
-    pipeline.add(nvosd)
-    pipeline.add(nvvidconv_postosd)
-    tiler.link(nvosd)
-    nvosd.link(nvvidconv_postosd)
-    debug("The OSD element has been added to the pipeline, and linked")
-
-
-
-
-
-
-    #########################################################################
-    # The next element in the pipeline is a caps filter
-    #########################################################################
-
-    debug("Creating a caps filter element (to enforce data format restrictions to help maintain stream consistency and processing efficiency)")
-
-    # Create a caps filter
-    caps = Gst.ElementFactory.make("capsfilter", "filter")
-    caps.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=I420"))
-    
-    # Add the caps filter to the pipeline, then link the OSD output to its input
-    pipeline.add(caps)
-    nvvidconv_postosd.link(caps)
-    debug("The caps filter element has been added to the pipeline, and linked")
-
-
-
-
-
-    #########################################################################
-    # The next element in the pipeline encodes the output (v4l2, h264)
-    #########################################################################
-
-    debug("Creating an element that converts output video to H264 for 4VL2")
-
-    # Make the encoder
-    if CODEC == "H264":
-        encoder = Gst.ElementFactory.make("nvv4l2h264enc", "encoder")
-        debug("Creating H264 Encoder")
-    elif CODEC == "H265":
-        encoder = Gst.ElementFactory.make("nvv4l2h265enc", "encoder")
-        debug("Creating H265 Encoder")
-    if not encoder:
-        sys.stderr.write("ERROR: Unable to create encoder")
-        sys.exit(1)
-    encoder.set_property('bitrate', int(BITRATE))
-    if is_aarch64():
-        encoder.set_property('preset-level', 1)
-        encoder.set_property('insert-sps-pps', 1)
-        encoder.set_property('bufapi-version', 1)
-    
-    # Add the V$L2/H264 encoder element to the pipeline, then link the caps filter to it
-    pipeline.add(encoder)
-    caps.link(encoder)
-    debug("The encoder element has been added to the pipeline, and linked")
-
-
-
-
-
-
-    #########################################################################
-    # The next element in the pipeline encodes the output into RTP packets
-    #########################################################################
+        if name.find("synthetic://") == 0:
+            sources.append(lambda i=i: create_synthetic_source_bin(i, rois.get(i)))
+        else:
+            sources.append(lambda i=i, name=name: create_source_bin(i, name, rois.get(i)))
 
-    debug("Creating an element that encapsulates video into RTP packets for RTSP streaming")
-
-    # Make the payload-encode video into RTP packets
-    if CODEC == "H264":
-        rtppay = Gst.ElementFactory.make("rtph264pay", "rtppay")
-        debug("Creating H264 rtppay")
-    elif CODEC == "H265":
-        rtppay = Gst.ElementFactory.make("rtph265pay", "rtppay")
-        debug("Creating H265 rtppay")
-    if not rtppay:
-        sys.stderr.write("ERROR: Unable to create rtppay")
+    # Secondary inference stages (SGIEs) classify some of the objects found
+    # by the PGIE (e.g., to find the color of the vehicles). They are listed
+    # in SECONDARY_INFERENCE, and described in SECONDARY_CONFIG_FILE. See
+    # "secondary.py" for details. By default there are none. Each one gets
+    # an nvinfer config file generated from its section in the file.
+    try:
+        stages = secondary.load_stages(SECONDARY_CONFIG_FILE, SECONDARY_INFERENCE) if SECONDARY_INFERENCE else []
+    except ValueError as e:
+        sys.stderr.write("ERROR: %s\n" % e)
         sys.exit(1)
+    sgie_folder_name = tempfile.mkdtemp()
+    stage_configs = []
+    for stage in stages:
+        stage_configs.append((stage, stage.write_config(sgie_folder_name)))
+        # So the probe can name the results from this stage
+        probe.secondary_names[stage.gie_id] = stage.name
+        print('Secondary inference: "%s" (gie-unique-id %d) on class ids %s, objects at least %dx%d' % (stage.name, stage.gie_id, sorted(stage.class_ids) or 'all', stage.min_width, stage.min_height))
+
+    # The RTSP stream output sinks send to local multicast UDP ports. These
+    # are received by the GstRtspStreamer instance created below once the
+    # pipeline is started. See "GstRtspStreamer" below for details.
+    UDP_MULTICAST_ADDRESS = '224.224.255.255'
+    UDP_MULTICAST_PORT = 5400
 
-    # Add the RTP packet encoder element to the pipeline, then link the H264 encoder onto it
-    pipeline.add(rtppay)
-    encoder.link(rtppay)
-    debug("The RTP packet encoder element has been added to the pipeline, and linked")
-
-
-
-
+    settings = {
+        'sources': sources,
+        'probe': osd_sink_pad_buffer_probe,
+        'config_file': CONFIG_FILE,
+        'stages': stage_configs,
+        'tracker_lib': TRACKER_LIB,
+        'aarch64': is_aarch64(),
+        'mem_type': None if is_aarch64() else int(pyds.NVBUF_MEM_CUDA_UNIFIED),
+        'mux_width': MUX_WIDTH,
+        'mux_height': MUX_HEIGHT,
+        'output_width': OUTPUT_WIDTH,
+        'output_height': OUTPUT_HEIGHT,
+        'codec': CODEC,
+        'bitrate': BITRATE,
+        'preset_level': PRESET_LEVEL,
+        'output_queue': OUTPUT_QUEUE,
+        'output_sync': OUTPUT_SYNC,
+        'software_encoder': SOFTWARE_ENCODER,
+        'output_pacing': OUTPUT_PACING,
+        'udp_host': UDP_MULTICAST_ADDRESS,
+        'udp_port': UDP_MULTICAST_PORT,
+        'rtsp_path': RTSPOUTPUTPATH,
+    }
 
 
     #########################################################################
-    # The final "sink element" in the pipeline is the RTSP output stream sink
+    # Build the pipeline from the profile's description of it
     #########################################################################
 
-    # As an alternative, you could send the output nowhere (the "fake" sink)
-    #debug("Creating FAKE sink")
-    #sink = Gst.ElementFactory.make("fakesink", "nvvideo-renderer")
-    #if not sink:
-    #    sys.stderr.write("ERROR: Unable to create FAKE sink\n")
-    #    sys.exit(1)
-    #sink.set_property("sync", 0)
-
-    # As an alternative, you could send the output to the screen
-    #debug("Creating EGLSink")
-    #sink = Gst.ElementFactory.make("nveglglessink", "nvvideo-renderer")
-    #if not sink:
-    #    sys.stderr.write("ERROR: Unable to create egl sink\n")
-    #    sys.exit(1)
-    #sink.set_property("sync", 0)
-
-    debug("Creating RTSP output stream sink...")
-
-    # The RTSP stream output sink sends to this local multicast UDP port
-    # This is received by the GstRtspStreamer instance created below once
-    # the pipeline is started. See "GstRtspStreamer" below for details.
-    UDP_MULTICAST_ADDRESS = '224.224.255.255'
-    UDP_MULTICAST_PORT = 5400
-    sink = Gst.ElementFactory.make("udpsink", "udpsink")
-    if not sink:
-        sys.stderr.write("ERROR: Unable to create udpsink")
+    debug("Building the \"%s\" pipeline" % PIPELINE_PROFILE)
+    spec = profiles.PROFILES[PIPELINE_PROFILE](settings)
+    try:
+        pipeline, elements = builder.build(spec)
+    except ValueError as e:
+        sys.stderr.write("ERROR: %s\n" % e)
         sys.exit(1)
-    sink.set_property('host', UDP_MULTICAST_ADDRESS)
-    sink.set_property('port', UDP_MULTICAST_PORT)
-    sink.set_property('async', False)
-
-    # The command below tells it to sync to a clock (1) or don't sync (0).
-    # I find that using 1 slows things down, but it seems much more regular.
-    # When I use 0 it is much faster but it freezes intermittently.
-    sink.set_property("sync", 0)
+    debug("The pipeline has been built, with %d elements" % len(elements))
+
+    # Pace the outputs the profile put pacer queues in (see "pacing.py").
+    # Each queue gets its own Pacer, run by the two probes on it (see
+    # "pacing_arrival_probe" and "pacing_release_probe" above).
+    for queue_name, output_name in spec['pacers']:
+        pacer = pacing.Pacer(output_name, PACING_MIN_DELAY_MS / 1000.0, PACING_MAX_DELAY_MS / 1000.0)
+        queue = elements[queue_name]
+        queue.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, pacing_arrival_probe, pacer)
+        queue.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, pacing_release_probe, pacer)
+        pacing.pacers.append(pacer)
+
+    # Start any optional exports of the probe's results (e.g., to share the
+    # detections with other processes on this host). See "exports.py".
+    exports.start(len(RTSP_INPUTS))
     
-    # Add the RTSP output stream sink element to the pipeline, then link the RTP paket encoder onto it
-    pipeline.add(sink)
-    rtppay.link(sink)
-    debug("The RTSP output stream element has been added to the pipeline, and linked")
-
 
 
 
@@ -794,6 +694,18 @@ def main(args):
     bus = pipeline.get_bus()
     bus.add_signal_watch()
     bus.connect ("message", bus_call, loop)
+
+    # If requested, run as a soak test (see "soak_sample" above)
+    monitor = None
+    if SOAK_SECONDS > 0:
+        print('Soak test: running for %ds, sampling every %ds' % (SOAK_SECONDS, SOAK_INTERVAL))
+        monitor = soak.monitor_from_settings()
+        probe.frame_hooks.append(monitor.frame)
+        GObject.timeout_add_seconds(SOAK_INTERVAL, soak_sample, monitor, loop)
+
+    # If the output is paced, report how it's going now and then
+    if pacing.pacers and PACING_REPORT > 0:
+        GObject.timeout_add_seconds(PACING_REPORT, pacing_report)
     
 
 
@@ -809,15 +721,18 @@ def main(args):
     # other hosts.
     #########################################################################
 
-    server = GstRtspServer.RTSPServer.new()
-    server.props.service = RTSPOUTPUTPORTNUM
-    server.attach(None)
-    
-    factory = GstRtspServer.RTSPMediaFactory.new()
-    factory.set_launch( "( udpsrc name=pay0 port=%d buffer-size=524288 caps=\"application/x-rtp, media=video, clock-rate=90000, encoding-name=(string)%s, payload=96 \" )" % (UDP_MULTICAST_PORT, CODEC))
-    factory.set_shared(True)
-    server.get_mount_points().add_factory(RTSPOUTPUTPATH, factory)
-    debug("RTSP output stream service is ready")
+    # One RTSP output stream for each output the profile sends (if any)
+    if spec['outputs']:
+        server = GstRtspServer.RTSPServer.new()
+        server.props.service = RTSPOUTPUTPORTNUM
+        server.attach(None)
+        for udp_port, rtsp_path in spec['outputs']:
+            factory = GstRtspServer.RTSPMediaFactory.new()
+            factory.set_launch( "( udpsrc name=pay0 port=%d buffer-size=524288 caps=\"application/x-rtp, media=video, clock-rate=90000, encoding-name=(string)%s, payload=96 \" )" % (udp_port, CODEC))
+            factory.set_shared(True)
+            server.get_mount_points().add_factory(rtsp_path, factory)
+            print('RTSP output stream: "rtsp://%s:%s%s"' % (IPADDR, RTSPOUTPUTPORTNUM, rtsp_path))
+        debug("RTSP output stream service is ready")
 
 
 
@@ -839,6 +754,10 @@ def main(args):
     # Attempt cleanup on error
     pipeline.set_state(Gst.State.NULL)
 
+    # Soak tests report their results, and pass or fail, on the way out
+    if monitor:
+        return monitor.report()
+
 
 
 
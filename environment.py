@@ -0,0 +1,19 @@
+#
+# Configuration from the process environment (MegaMosquito)
+#
+# The one helper deepstream-rtsp.py, the modules it shares with the test
+# tools (e.g., "exports.py" and "soak.py"), and the test and benchmark tools
+# themselves (latency-test.py, soak-test.py, ring-bench.py, ...) all use to
+# read their settings, so they all read them the same way.
+#
+
+import os
+
+
+# Return the value of environment variable "v", or "d" if it is not set (or
+# is empty)
+def get_from_env(v, d):
+  if v in os.environ and '' != os.environ[v]:
+    return os.environ[v]
+  else:
+    return d
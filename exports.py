@@ -0,0 +1,47 @@
+#
+# Optional exports of the probe's results (MegaMosquito)
+#
+# Each export is hooked into the probe (see "frame_hooks" in "probe.py") if
+# its settings are present in the process environment. This is shared by
+# deepstream-rtsp.py and soak-test.py, so the soak test exercises the same
+# export paths as the real pipeline.
+#
+#   DETECTIONS_RING       path of a shared memory ring buffer to publish
+#                         every detection into (see "shmring.py"), e.g.,
+#                         /dev/shm/slipstream-detections (default is off)
+#   DETECTIONS_RING_SIZE  number of detection records the ring holds
+#   STATS_PORT            port for an HTTP endpoint serving the rolling
+#                         per-source, per-class counts (see "stats.py"),
+#                         e.g., 8555 (the default is off). The output
+#                         pacing counts (see "pacing.py") are served on
+#                         the same port, at "/pacing".
+#
+
+from environment import get_from_env
+import probe
+import pacing
+import shmring
+import stats
+
+
+# Start the exports that are configured, and return a list of them
+def start(num_sources):
+    started = []
+
+    ring_path = get_from_env('DETECTIONS_RING', '')
+    if '' != ring_path:
+        ring = shmring.RingWriter(ring_path, int(get_from_env('DETECTIONS_RING_SIZE', '65536')))
+        probe.frame_hooks.append(ring.frame)
+        print('Publishing detections to shared memory ring: "%s" (%d records)' % (ring_path, ring.capacity))
+        started.append(ring)
+
+    stats_port = get_from_env('STATS_PORT', '')
+    if '' != stats_port:
+        store = stats.StatsStore(num_sources, probe.PGIE_CLASS_NAMES)
+        probe.frame_hooks.append(store.frame)
+        stats.pages['/pacing'] = pacing.report
+        stats.serve(store, int(stats_port))
+        print('Serving per-source statistics on: "http://<IPADDRESS>:%s/stats"' % stats_port)
+        started.append(store)
+
+    return started
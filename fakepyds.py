@@ -0,0 +1,229 @@
+#
+# A stand-in for the NVIDIA Deepstream Python bindings ("pyds") (MegaMosquito)
+#
+# This implements just enough of the pyds API for "probe.py" (and anything
+# hooked into it) to run on a machine with no GPU and no Deepstream, e.g.,
+# in CI. It is used by "soak-test.py" like this:
+#
+#    import fakepyds
+#    sys.modules['pyds'] = fakepyds
+#    import probe
+#
+# It also makes batches of synthetic metadata for the probe to chew on, and
+# has a stand-in for the secondary classifiers (see "StandInClassifier").
+#
+# The real pyds allocates C memory for some things (e.g., the display text
+# strings) that the Python garbage collector does not manage. The memory is
+# returned when the buffer carrying the metadata is freed. This stand-in
+# keeps count of those "C" allocations, so a soak test can tell if they are
+# growing (see "outstanding" and "release_batch" below).
+#
+
+# Memory type constant used by deepstream-rtsp.py
+NVBUF_MEM_CUDA_UNIFIED = 3
+
+
+# Outstanding stand-in "C" allocations (address -> Python object)
+_allocations = {}
+_next_address = [0x1000]
+
+def _allocate(value):
+    address = _next_address[0]
+    _next_address[0] += 1
+    _allocations[address] = value
+    return address
+
+def _free(address):
+    _allocations.pop(address, None)
+
+# Return the number of stand-in "C" allocations that have not been freed
+def outstanding():
+    return len(_allocations)
+
+
+#
+# The metadata lists are singly linked lists (GList), walked with ".next"
+#
+class GList:
+    def __init__(self, data, next=None):
+        self.data = data
+        self.next = next
+
+def _glist(items):
+    head = None
+    for item in reversed(items):
+        head = GList(item, head)
+    return head
+
+
+class NvOSD_ColorParams:
+    def __init__(self):
+        self.red = self.green = self.blue = self.alpha = 0.0
+    def set(self, red, green, blue, alpha):
+        self.red, self.green, self.blue, self.alpha = red, green, blue, alpha
+
+class NvOSD_FontParams:
+    def __init__(self):
+        self.font_name = None
+        self.font_size = 0
+        self.font_color = NvOSD_ColorParams()
+
+class NvOSD_RectParams:
+    def __init__(self, left=0.0, top=0.0, width=0.0, height=0.0):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+class NvOSD_TextParams:
+    def __init__(self):
+        self._display_text = 0
+        self.x_offset = 0
+        self.y_offset = 0
+        self.font_params = NvOSD_FontParams()
+        self.set_bg_clr = 0
+        self.text_bg_clr = NvOSD_ColorParams()
+
+    # Like pyds, setting the text allocates a "C" string, and reading it
+    # returns the string's address (use get_string to read the contents)
+    @property
+    def display_text(self):
+        return self._display_text
+    @display_text.setter
+    def display_text(self, value):
+        _free(self._display_text)
+        self._display_text = _allocate(str(value))
+
+def get_string(address):
+    return _allocations[address]
+
+
+class NvDsDisplayMeta:
+    def __init__(self):
+        self.num_labels = 0
+        self.text_params = [NvOSD_TextParams() for i in range(16)]
+
+class NvDsLabelInfo:
+    def __init__(self, result_class_id, result_label, result_prob):
+        self.label_id = 0
+        self.result_class_id = result_class_id
+        self.result_label = result_label
+        self.result_prob = result_prob
+    @staticmethod
+    def cast(data):
+        return data
+
+class NvDsClassifierMeta:
+    def __init__(self, unique_component_id):
+        self.unique_component_id = unique_component_id
+        self.num_labels = 0
+        self.label_info_list = None
+    @staticmethod
+    def cast(data):
+        return data
+
+class NvDsObjectMeta:
+    def __init__(self, class_id, confidence, left, top, width, height):
+        self.class_id = class_id
+        self.confidence = confidence
+        self.rect_params = NvOSD_RectParams(left, top, width, height)
+        self.obj_label = ''
+        self.classifier_meta_list = None
+    @staticmethod
+    def cast(data):
+        return data
+
+class NvDsFrameMeta:
+    def __init__(self, source_id, frame_num, objects):
+        self.source_id = source_id
+        self.batch_id = 0
+        self.frame_num = frame_num
+        self.num_obj_meta = len(objects)
+        self.obj_meta_list = _glist(objects)
+        self.display_meta = []
+    @staticmethod
+    def cast(data):
+        return data
+
+class NvDsBatchMeta:
+    def __init__(self, frames):
+        self.frames = frames
+        self.frame_meta_list = _glist(frames)
+        self.display_meta_pool = []
+
+
+def nvds_acquire_display_meta_from_pool(batch_meta):
+    display_meta = NvDsDisplayMeta()
+    batch_meta.display_meta_pool.append(display_meta)
+    return display_meta
+
+def nvds_add_display_meta_to_frame(frame_meta, display_meta):
+    frame_meta.display_meta.append(display_meta)
+
+
+#
+# Make a batch of metadata. "frames" is a list with one entry per frame:
+#    (source_id, frame_num, objects)
+# where "objects" is a list of detections, each one:
+#    (class_id, confidence, left, top, width, height)
+#
+def make_batch(frames):
+    metas = []
+    for source_id, frame_num, objects in frames:
+        objs = [NvDsObjectMeta(*o) for o in objects]
+        metas.append(NvDsFrameMeta(source_id, frame_num, objs))
+    return NvDsBatchMeta(metas)
+
+# Attach a secondary classifier result to an object, as nvinfer does (see
+# "StandInClassifier" below)
+def add_classifier_result(obj_meta, unique_component_id, result_class_id, result_label, result_prob):
+    classifier_meta = NvDsClassifierMeta(unique_component_id)
+    classifier_meta.num_labels = 1
+    classifier_meta.label_info_list = GList(NvDsLabelInfo(result_class_id, result_label, result_prob))
+    obj_meta.classifier_meta_list = GList(classifier_meta, obj_meta.classifier_meta_list)
+
+# Free the stand-in "C" memory held by a batch, as happens in Deepstream
+# when the buffer carrying the batch is freed downstream.
+def release_batch(batch_meta):
+    for display_meta in batch_meta.display_meta_pool:
+        for text_params in display_meta.text_params:
+            _free(text_params.display_text)
+            text_params._display_text = 0
+    batch_meta.display_meta_pool = []
+
+
+#
+# A stand-in for a secondary classifier (a secondary.Stage). It gates
+# objects just as the real stage would (see "Stage.accepts") and
+# attaches a (made up, but repeatable) result to those that pass, the same
+# way nvinfer attaches its results to the object metadata. In asynchronous
+# mode, nvinfer re-classifies each object now and then; this stand-in does
+# it in every frame it is called for.
+#
+class StandInClassifier:
+
+    def __init__(self, stage, labels=None):
+        self.stage = stage
+        if labels is None:
+            labels = stage.labels()
+        if not labels:
+            labels = ['%s-%d' % (stage.name, i) for i in range(4)]
+        self.labels = labels
+        # How many objects were classified, and how many were gated out
+        self.classified = 0
+        self.skipped = 0
+
+    # Classify the objects in a stand-in batch
+    def classify_batch(self, batch_meta):
+        for frame_meta in batch_meta.frames:
+            l_obj = frame_meta.obj_meta_list
+            while l_obj is not None:
+                obj_meta = l_obj.data
+                rect = obj_meta.rect_params
+                if self.stage.accepts(obj_meta.class_id, rect.width, rect.height):
+                    label_id = int(rect.left + rect.top) % len(self.labels)
+                    add_classifier_result(obj_meta, self.stage.gie_id, label_id, self.labels[label_id], 0.9)
+                    self.classified += 1
+                else:
+                    self.skipped += 1
+                l_obj = l_obj.next
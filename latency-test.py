@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+#
+# Glass-to-glass latency test harness (MegaMosquito)
+#
+# This runs the deepstream-rtsp.py pipeline on this host with a synthetic
+# input (see "create_synthetic_source_bin" in deepstream-rtsp.py), once for
+# each configuration given on the command line. For each run, it pulls the
+# RTSP output stream from localhost, reads the capture time stamp out of
+# every frame (see "latency.py") and reports the distributions of the
+# end-to-end latency, and of the jitter, for that configuration.
+#
+# Each configuration is a comma-separated list of environment variable
+# settings for deepstream-rtsp.py, e.g., to compare the udpsink sync modes:
+#
+#    python3 latency-test.py OUTPUT_SYNC=0 OUTPUT_SYNC=1
+#
+# or to compare encoder queue sizes, and (on Jetson) encoder presets:
+#
+#    python3 latency-test.py OUTPUT_QUEUE=0 OUTPUT_QUEUE=4,PRESET_LEVEL=2
+#
+# or to see what output pacing (see "pacing.py") does, compared to the two
+# sync modes, with the software encoder (which needs no NVIDIA encoder):
+#
+#    python3 latency-test.py SOFTWARE_ENCODER=yes,OUTPUT_SYNC=0 SOFTWARE_ENCODER=yes,OUTPUT_SYNC=1 SOFTWARE_ENCODER=yes,OUTPUT_PACING=yes
+#
+# With no arguments, the two sync modes are compared. The "full" and
+# "per-camera" PIPELINE_PROFILEs can be measured ("metadata-only" has no
+# video output to measure).
+#
+
+# Basic dependencies
+import os
+import sys
+import time
+import signal
+import subprocess
+
+
+# Configuration from the process environment (see "environment.py")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from environment import get_from_env
+CODEC = get_from_env('CODEC', 'H264')
+RTSPOUTPUTPORTNUM = get_from_env('RTSPOUTPUTPORTNUM', '8554')
+RTSPOUTPUTPATH = get_from_env('RTSPOUTPUTPATH', '/ds')
+PIPELINE_PROFILE = get_from_env('PIPELINE_PROFILE', 'full')
+LATENCY_WARMUP = float(get_from_env('LATENCY_WARMUP', '20')) # Seconds to wait for the pipeline
+LATENCY_SECONDS = float(get_from_env('LATENCY_SECONDS', '60')) # Seconds to measure each config
+LATENCY_CLIENT_BUFFER = int(get_from_env('LATENCY_CLIENT_BUFFER', '0')) # rtspsrc jitter buffer (ms)
+
+# The pipeline under test is this one, in this directory
+PIPELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deepstream-rtsp.py')
+
+# Gstreamer dependency
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, Gst
+
+import latency
+
+
+#
+# The client side. This pulls the RTSP stream, decodes it in software (so
+# the client does not compete with the pipeline for the hardware decoder),
+# converts it to 8-bit greyscale (all the barcode needs) and hands each
+# frame to "on_sample" which reads the stamp and records the latency.
+#
+def on_sample(appsink, results):
+    sample = appsink.emit("pull-sample")
+    now = time.time()
+    if not sample:
+        return Gst.FlowReturn.ERROR
+    structure = sample.get_caps().get_structure(0)
+    width = structure.get_value("width")
+    height = structure.get_value("height")
+    # GRAY8 rows are padded to a multiple of 4 bytes
+    stride = (width + 3) & ~3
+    buf = sample.get_buffer()
+    ok, info = buf.map(Gst.MapFlags.READ)
+    if not ok:
+        return Gst.FlowReturn.OK
+    try:
+        stamp = latency.read_stamp(info.data, width, height, stride)
+    finally:
+        buf.unmap(info)
+    if stamp is None:
+        results['unreadable'] += 1
+    else:
+        results['latencies'].append(now - latency.stamp_to_time(stamp, now))
+    return Gst.FlowReturn.OK
+
+def measure(seconds, codec, port, path):
+    depay = 'rtph265depay ! h265parse ! avdec_h265' if 'H265' == codec else 'rtph264depay ! h264parse ! avdec_h264'
+    description = (
+        'rtspsrc location=rtsp://127.0.0.1:%s%s latency=%d ! %s ! '
+        'videoconvert ! video/x-raw, format=GRAY8 ! '
+        'appsink name=sink emit-signals=true sync=false max-buffers=1 drop=false'
+        % (port, path, LATENCY_CLIENT_BUFFER, depay))
+    client = Gst.parse_launch(description)
+    results = { 'latencies': [], 'unreadable': 0 }
+    client.get_by_name('sink').connect("new-sample", on_sample, results)
+
+    # Run the client for the requested time, or until it fails
+    loop = GObject.MainLoop()
+    def on_message(bus, message):
+        if message.type == Gst.MessageType.ERROR:
+            err, dbg = message.parse_error()
+            sys.stderr.write("ERROR: client: %s\n" % err)
+            loop.quit()
+        elif message.type == Gst.MessageType.EOS:
+            loop.quit()
+    bus = client.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message", on_message)
+    GObject.timeout_add(int(seconds * 1000), loop.quit)
+    client.set_state(Gst.State.PLAYING)
+    loop.run()
+    client.set_state(Gst.State.NULL)
+    return results
+
+
+#
+# The RTSP path to pull for a configuration, or None if that configuration
+# has no RTSP output. With the one synthetic input, the "per-camera" profile
+# serves it with "0" on the end of the path (see "profiles.py").
+#
+def output_path(overrides):
+    profile = overrides.get('PIPELINE_PROFILE', PIPELINE_PROFILE)
+    path = overrides.get('RTSPOUTPUTPATH', RTSPOUTPUTPATH)
+    if 'full' == profile:
+        return path
+    if 'per-camera' == profile:
+        return path + '0'
+    return None
+
+
+#
+# The server side. Each configuration runs a fresh copy of the pipeline.
+#
+def run_config(overrides):
+    env = dict(os.environ)
+    env['RTSPINPUT'] = 'synthetic://'
+    env['SHOW_FRAMES'] = 'no'
+    env.update(overrides)
+    server = subprocess.Popen([sys.executable, PIPELINE], env=env, cwd=os.path.dirname(PIPELINE), stdout=subprocess.DEVNULL)
+    try:
+        time.sleep(LATENCY_WARMUP)
+        if server.poll() is not None:
+            sys.stderr.write("ERROR: pipeline exited (status %d) during warmup\n" % server.returncode)
+            return None
+        # The client must use the same codec and port as the pipeline, which
+        # gets the overrides (or else the same settings as here)
+        codec = overrides.get('CODEC', CODEC)
+        port = overrides.get('RTSPOUTPUTPORTNUM', RTSPOUTPUTPORTNUM)
+        return measure(LATENCY_SECONDS, codec, port, output_path(overrides))
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+def parse_config(arg):
+    overrides = {}
+    for setting in arg.split(','):
+        if '' == setting:
+            continue
+        if '=' not in setting:
+            sys.stderr.write('ERROR: configuration settings must be NAME=VALUE, not "%s"\n' % setting)
+            sys.exit(1)
+        name, value = setting.split('=', 1)
+        overrides[name] = value
+    return overrides
+
+def report(arg, results):
+    print('\n*** Configuration: %s' % arg)
+    if results is None:
+        print('  FAILED')
+        return
+    summary = latency.summarize(results['latencies'])
+    print('  frames: %d measured, %d unreadable' % (len(results['latencies']), results['unreadable']))
+    for name in ['latency_ms', 'jitter_ms']:
+        d = summary[name]
+        print('  %-10s  mean=%8.1f  min=%8.1f  p50=%8.1f  p90=%8.1f  p99=%8.1f  max=%8.1f' % (name, d['mean'], d['min'], d['p50'], d['p90'], d['p99'], d['max']))
+
+
+def main(args):
+    configs = args[1:] if len(args) > 1 else ['OUTPUT_SYNC=0', 'OUTPUT_SYNC=1']
+    # Check that every configuration has an output to measure, before
+    # running any of them
+    for arg in configs:
+        if output_path(parse_config(arg)) is None:
+            sys.stderr.write('ERROR: configuration "%s" has no RTSP output to measure (use PIPELINE_PROFILE=full or per-camera)\n' % arg)
+            return 1
+    Gst.init(None)
+    all_results = []
+    for arg in configs:
+        print('Measuring configuration: %s (warmup %ds, measure %ds)' % (arg, LATENCY_WARMUP, LATENCY_SECONDS))
+        all_results.append((arg, run_config(parse_config(arg))))
+    for arg, results in all_results:
+        report(arg, results)
+    return 0 if all(r is not None for a, r in all_results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,156 @@
+#
+# Glass-to-glass latency measurement support (MegaMosquito)
+#
+# The idea is simple. A synthetic source (see "create_synthetic_source_bin"
+# in deepstream-rtsp.py) paints the wall clock time into every frame it
+# creates, as a row of big black and white blocks across the bottom of the
+# picture (a crude barcode). That picture then goes through the whole
+# Deepstream pipeline, gets encoded, and is served over RTSP. A client on
+# the same host (see latency-test.py) pulls the RTSP output, reads the
+# barcode back out of each decoded frame, and subtracts it from its own
+# clock. Since both ends run on the same host, they share one clock, so the
+# difference is the end-to-end latency for that frame.
+#
+# The blocks are large so they survive scaling (tiler), drawing (OSD) and
+# lossy encoding (H264/H265). The barcode is at the bottom of the frame,
+# because the probe draws its text at the top left.
+#
+# The barcode has 56 cells (bits), most significant bit first:
+#    48 bits: capture time, in microseconds, modulo 2^48 (wraps in ~9 years)
+#     8 bits: checksum, so damaged or absent barcodes are rejected
+#
+
+import math
+
+
+# Barcode geometry (shared by the stamping and reading sides)
+STAMP_BITS = 48
+STAMP_CELLS = STAMP_BITS + 8
+STAMP_BAND = 12 # The barcode occupies the bottom 1/STAMP_BAND of the frame
+
+# Luma values for the cells (video range), and the read-back threshold
+STAMP_BLACK = 16
+STAMP_WHITE = 235
+STAMP_THRESHOLD = 128
+
+STAMP_MASK = (1 << STAMP_BITS) - 1
+
+
+# The checksum is the byte sum of the stamp, XORed with a constant so an
+# all-black (or all-white) band is never read as a valid stamp.
+def _checksum(stamp):
+    total = 0
+    for i in range(STAMP_BITS // 8):
+        total += (stamp >> (8 * i)) & 0xff
+    return (total & 0xff) ^ 0xa5
+
+
+# Convert a time (in seconds, as returned by time.time()) to the stamp value
+def time_to_stamp(t):
+    return int(round(t * 1000000)) & STAMP_MASK
+
+
+# Convert a stamp back to a time in seconds. The stamp has wrapped, so the
+# caller's current time is used to restore the missing high-order bits.
+def stamp_to_time(stamp, now):
+    now_us = int(round(now * 1000000))
+    t_us = (now_us & ~STAMP_MASK) | stamp
+    if t_us > now_us + (STAMP_MASK >> 1):
+        t_us -= STAMP_MASK + 1
+    return t_us / 1000000.0
+
+
+# Return the first row of the barcode band for a frame of this height
+def _band_top(height):
+    return height - max(2, height // STAMP_BAND)
+
+
+# Return the list of bits (0 or 1) to paint for this stamp value
+def _stamp_bits(stamp):
+    value = (stamp << 8) | _checksum(stamp)
+    return [(value >> (STAMP_CELLS - 1 - i)) & 1 for i in range(STAMP_CELLS)]
+
+
+#
+# Paint a stamp into the luma (Y) plane of a frame. The frame is a bytearray
+# holding a planar YUV frame (e.g., I420) whose Y plane starts at offset 0.
+# Each luma row is "stride" bytes long (by default, the width).
+#
+def paint_stamp(frame, width, height, stamp, stride=None):
+    if stride is None:
+        stride = width
+    row = bytearray(width)
+    bits = _stamp_bits(stamp)
+    for i in range(STAMP_CELLS):
+        x0 = (i * width) // STAMP_CELLS
+        x1 = ((i + 1) * width) // STAMP_CELLS
+        row[x0:x1] = bytes([STAMP_WHITE if bits[i] else STAMP_BLACK]) * (x1 - x0)
+    for y in range(_band_top(height), height):
+        frame[y * stride:y * stride + width] = row
+
+
+#
+# Read a stamp back from a luma (or GRAY8) frame. Each cell is sampled in
+# the middle of the band, over the middle half of the cell width, so the
+# soft edges left by scaling and encoding are ignored. Returns the stamp
+# value, or None if no valid stamp is present.
+#
+def read_stamp(frame, width, height, stride=None):
+    if stride is None:
+        stride = width
+    top = _band_top(height)
+    y = (top + height) // 2
+    value = 0
+    for i in range(STAMP_CELLS):
+        x0 = (i * width) // STAMP_CELLS
+        x1 = ((i + 1) * width) // STAMP_CELLS
+        q = (x1 - x0) // 4
+        samples = frame[y * stride + x0 + q:y * stride + x1 - q]
+        if len(samples) == 0:
+            return None
+        bit = 1 if (sum(samples) / len(samples)) >= STAMP_THRESHOLD else 0
+        value = (value << 1) | bit
+    stamp = value >> 8
+    if (value & 0xff) != _checksum(stamp):
+        return None
+    return stamp
+
+
+#
+# Summary statistics for a list of per-frame samples. Latencies are in
+# seconds (as measured) and are reported in milliseconds.
+#
+# "jitter" is the distribution of the change in latency from one frame to
+# the next (the same idea as the RTP interarrival jitter in RFC 3550). This
+# is what viewers perceive as uneven playback, even when the average latency
+# is fine.
+#
+def _percentile(ordered, p):
+    if not ordered:
+        return float('nan')
+    k = (len(ordered) - 1) * p / 100.0
+    lo = int(math.floor(k))
+    hi = int(math.ceil(k))
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+def _distribution(values):
+    ordered = sorted(values)
+    n = len(ordered)
+    mean = sum(ordered) / n if n else float('nan')
+    return {
+        'count': n,
+        'mean': mean,
+        'min': ordered[0] if n else float('nan'),
+        'p50': _percentile(ordered, 50),
+        'p90': _percentile(ordered, 90),
+        'p99': _percentile(ordered, 99),
+        'max': ordered[-1] if n else float('nan'),
+    }
+
+def summarize(latencies):
+    ms = [1000.0 * v for v in latencies]
+    jitter = [abs(ms[i] - ms[i - 1]) for i in range(1, len(ms))]
+    return {
+        'latency_ms': _distribution(ms),
+        'jitter_ms': _distribution(jitter),
+    }
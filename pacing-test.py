@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+#
+# Output pacing checks (MegaMosquito)
+#
+# This checks the Pacer (see "pacing.py") on synthetic streams (see
+# "checks.py"):
+#
+#    python3 pacing-test.py
+#
+# Synthetic streams of frames (time stamps, arrival times at the pacer
+# queue, and keyframe flags) are fed to a Pacer, as the probes on the queue
+# would feed them, with a stand-in encoder that makes a keyframe a few frames
+# after one is asked for (the frames already in the queue are not
+# keyframes). It checks:
+#   - a steady stream, with a little jitter, goes out at the source frame
+#     rate, evenly spaced, with nothing dropped
+#   - the output jitter is measured from when frames really leave, after
+#     their wait (so oversleeping shows up in it)
+#   - after a stall, the late frames are dropped, a keyframe is asked for
+#     once, the frames after the drops are held back (dropped) until that
+#     keyframe, and then the stream carries on as before
+#   - while no keyframe comes, it is asked for again every KEYFRAME_RETRY
+#   - keyframes are never dropped, however late they are
+#   - a jump in the time stamps (e.g., a source that restarts) restarts the
+#     transit measurement, instead of dropping, or holding, everything after
+#
+# The exit status is 0 if all checks pass.
+#
+
+# Basic dependencies
+import os
+import sys
+import random
+
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import pacing
+from checks import check
+import checks
+
+FPS = 30.0
+INTERVAL = 1.0 / FPS
+
+# Frames between keyframes
+GOP = 30
+
+# How many frames after a keyframe is asked for the stand-in encoder's
+# keyframe gets to the pacer
+RESPONSE = 5
+
+# How long frames take to get to the pacer queue (seconds), and by how much
+# that varies
+TRANSIT = 0.5
+JITTER = 0.004
+
+MIN_DELAY = 0.02
+MAX_DELAY = 0.2
+
+#
+# Run the frames through a new Pacer. "frames" is a list of (pts, arrival),
+# there is a keyframe every "gop" frames, and "responds" is True if the
+# stand-in encoder makes a keyframe (RESPONSE frames later) when asked.
+# Frames leave the queue in order, each when it has arrived and the one
+# before it has gone, and after its wait, plus up to "oversleep" seconds
+# (like "time.sleep" in the probe). Returns the pacer and a list of (pts,
+# keyframe, wait, request, now, out) for each frame.
+#
+def run(frames, responds=True, gop=GOP, oversleep=0.0):
+    p = pacing.Pacer('test', MIN_DELAY, MAX_DELAY)
+    results = []
+    free_at = 0.0
+    next_keyframe = None
+    for i, (pts, arrival) in enumerate(frames):
+        keyframe = (0 == i % gop) or (next_keyframe is not None and i >= next_keyframe)
+        if keyframe:
+            next_keyframe = None
+        p.arrive(arrival)
+        now = max(arrival, free_at)
+        wait, request = p.depart(pts, keyframe, now)
+        out = None if wait is None else now + wait + random.uniform(0, oversleep)
+        if out is not None:
+            p.released(out)
+            free_at = out
+        if request and responds and next_keyframe is None:
+            next_keyframe = i + RESPONSE
+        results.append((pts, keyframe, wait, request, now, out))
+    return p, results
+
+
+# The gaps between the frames sent (seconds)
+def gaps(results):
+    sent = [o for pts, k, w, r, n, o in results if o is not None]
+    return [b - a for a, b in zip(sent, sent[1:])] or [0.0]
+
+
+# The longest a frame sent was held (seconds)
+def longest_wait(results):
+    return max([w for pts, k, w, r, n, o in results if w is not None] or [0.0])
+
+
+def steady(count, start=0.0):
+    return [(start + i * INTERVAL, start + i * INTERVAL + TRANSIT + random.uniform(0, JITTER)) for i in range(count)]
+
+
+def check_steady():
+    frames = steady(300)
+    p, results = run(frames)
+    s = p.snapshot()
+    check(s['sent'] == 300, 'steady: %d of 300 frames sent' % s['sent'])
+    check(s['dropped_late'] == 0 and s['dropped_resync'] == 0 and s['keyframes_requested'] == 0, 'steady: frames dropped, or keyframes asked for: %s' % s)
+    check(abs(s['fps'] - FPS) < 0.01, 'steady: measured %s fps, should be %s' % (s['fps'], FPS))
+    check(MIN_DELAY * 1000.0 <= s['delay_ms'] <= MAX_DELAY * 1000.0, 'steady: the delay %s ms is outside the limits' % s['delay_ms'])
+    check(s['jitter_ms'] < 1.0, 'steady: the output jitter is %s ms' % s['jitter_ms'])
+    check(all(w is not None and w >= 0.0 for pts, k, w, r, n, o in results), 'steady: a frame dropped, or a negative wait')
+    g = gaps(results[100:])
+    check(all(abs(x - INTERVAL) < 0.002 for x in g), 'steady: the output is not evenly spaced (gaps from %.4f to %.4f)' % (min(g), max(g)))
+    # It adds no more delay than it needs
+    held = max(o - a for (pts, a), (x, k, w, r, n, o) in zip(frames, results))
+    check(held <= MIN_DELAY + 2 * JITTER, 'steady: frames held for up to %.4f seconds' % held)
+    for key in ['name', 'fps', 'delay_ms', 'jitter_ms', 'sent', 'dropped_late', 'dropped_resync', 'drop_bursts', 'longest_burst', 'keyframes_requested']:
+        check(key in s, 'snapshot: no "%s"' % key)
+
+
+def check_jitter():
+    # The pacer's schedule is even, but the jitter must be measured from when
+    # the frames really go: oversleeping by up to 10ms shows up in it
+    p, results = run(steady(300), oversleep=0.01)
+    s = p.snapshot()
+    check(2.0 < s['jitter_ms'] < 6.0, 'jitter: with up to 10ms oversleeping, the output jitter is %s ms' % s['jitter_ms'])
+    check(s['sent'] == 300 and s['dropped_late'] == 0, 'jitter: frames dropped: %s' % s)
+    # Frames dropped are not counted as jitter (the gap is in the time stamps)
+    p, results = run(stalled(300, 100, 10))
+    check(p.snapshot()['jitter_ms'] < 1.0, 'jitter: after a stall, the output jitter is %s ms' % p.snapshot()['jitter_ms'])
+
+
+# A steady stream, except the frames from "stall" to "stall + count" are
+# held up, and all arrive together just after the last of them was due
+def stalled(total, stall, count):
+    frames = steady(total)
+    release = frames[stall + count][1]
+    return [(pts, release if stall <= i < stall + count else arrival) for i, (pts, arrival) in enumerate(frames)]
+
+
+def check_stall():
+    stall, count = 100, 10
+    p, results = run(stalled(300, stall, count))
+    s = p.snapshot()
+    check(all(w is not None for pts, k, w, r, n, o in results[:stall]), 'stall: frames dropped before the stall')
+    # The first late frame is dropped, and a keyframe is asked for, once
+    check(results[stall][2] is None, 'stall: the first late frame was sent')
+    requests = [i for i, (pts, k, w, r, n, o) in enumerate(results) if r]
+    check(requests == [stall], 'stall: keyframes were asked for at frames %s, should be [%d]' % (requests, stall))
+    # Everything from then up to the keyframe the encoder makes is dropped,
+    # the late frames, and the ones after them (held back for the keyframe)
+    first = stall + RESPONSE
+    check(results[first][1], 'stall: the stand-in encoder made no keyframe at frame %d' % first)
+    check(all(results[i][2] is None for i in range(stall, first)), 'stall: a frame between the drop and the keyframe was sent')
+    check(results[first][2] is not None, 'stall: the keyframe after the drops was dropped')
+    check(s['dropped_late'] > 0 and s['dropped_resync'] > 0, 'stall: %d frames dropped late, and %d held back for the keyframe' % (s['dropped_late'], s['dropped_resync']))
+    check(s['dropped_late'] + s['dropped_resync'] == first - stall, 'stall: %d frames dropped, should be %d' % (s['dropped_late'] + s['dropped_resync'], first - stall))
+    check(s['drop_bursts'] == 1 and s['longest_burst'] == first - stall, 'stall: %d bursts, the longest %d frames, should be 1 of %d' % (s['drop_bursts'], s['longest_burst'], first - stall))
+    # And then it carries on as before (once the delay, raised by the stall,
+    # has settled again)
+    after = results[first:]
+    check(all(w is not None for pts, k, w, r, n, o in after), 'stall: frames dropped after the keyframe')
+    check(s['sent'] == len(results) - (first - stall), 'stall: %d frames sent, should be %d' % (s['sent'], len(results) - (first - stall)))
+    g = gaps(after[100:])
+    check(all(abs(x - INTERVAL) < 0.002 for x in g), 'stall: the output is not evenly spaced after it (gaps from %.4f to %.4f)' % (min(g), max(g)))
+    check(abs(s['fps'] - FPS) < 0.01, 'stall: measured %s fps, should be %s' % (s['fps'], FPS))
+
+
+def check_retry():
+    # The encoder doesn't respond, so the frames are dropped up to the next
+    # regular keyframe (frame 200), asking again every KEYFRAME_RETRY
+    stall, count, gop = 110, 10, 100
+    p, results = run(stalled(300, stall, count), False, gop)
+    s = p.snapshot()
+    requests = [i for i, (pts, k, w, r, n, o) in enumerate(results) if r]
+    check(len(requests) == 3 and requests[0] == stall, 'retry: keyframes were asked for at frames %s, should be 3 times from %d' % (requests, stall))
+    times = [results[i][4] for i in requests]
+    check(all(pacing.KEYFRAME_RETRY < b - a <= pacing.KEYFRAME_RETRY + INTERVAL + JITTER for a, b in zip(times, times[1:])), 'retry: keyframes were asked for at %s seconds' % times)
+    check(all(r[2] is None for r in results[stall:2 * gop]) and results[2 * gop][2] is not None, 'retry: the frames up to the next keyframe were not all dropped')
+    check(s['keyframes_requested'] == len(requests), 'retry: keyframes_requested is %d, should be %d' % (s['keyframes_requested'], len(requests)))
+    check(s['longest_burst'] == 2 * gop - stall, 'retry: the longest burst is %d frames, should be %d' % (s['longest_burst'], 2 * gop - stall))
+
+
+def check_keyframes():
+    # Keyframes are never dropped, even when they are very late: here the
+    # stall starts at a keyframe, which goes straight out, and the late
+    # frames after it are dropped
+    stall = GOP * 3
+    p, results = run(stalled(300, stall, 10), False)
+    check(all(w is not None for pts, k, w, r, n, o in results if k), 'keyframes: a keyframe was dropped')
+    check(results[stall][1] and results[stall][2] == 0.0, 'keyframes: the late keyframe was held (for %s seconds)' % results[stall][2])
+    check(results[stall + 1][2] is None and p.dropped_late > 0, 'keyframes: the late frames after the keyframe were sent')
+
+
+def check_transit_jump():
+    # The time stamps go back to 0 half way through (e.g., the source
+    # restarted), but the frames keep arriving as before
+    frames = steady(150)
+    frames += [(pts, arrival + 150 * INTERVAL) for pts, arrival in steady(150)]
+    p, results = run(frames)
+    s = p.snapshot()
+    check(s['dropped_late'] == 0 and s['dropped_resync'] == 0, 'transit jump: %d frames dropped' % (s['dropped_late'] + s['dropped_resync']))
+    check(longest_wait(results) <= MAX_DELAY + JITTER, 'transit jump: frames held for up to %.3f seconds' % longest_wait(results))
+    check(abs(s['fps'] - FPS) < 0.01, 'transit jump: measured %s fps, should be %s' % (s['fps'], FPS))
+    # And the same, the other way (the time stamps jump forward)
+    frames = steady(150)
+    frames += [(pts + 100.0, arrival + 150 * INTERVAL) for pts, arrival in steady(150)]
+    p, results = run(frames)
+    check(p.dropped_late == 0 and p.dropped_resync == 0, 'transit jump forward: %d frames dropped' % (p.dropped_late + p.dropped_resync))
+    check(longest_wait(results) <= MAX_DELAY + JITTER, 'transit jump forward: frames held for up to %.3f seconds' % longest_wait(results))
+
+
+def main(args):
+    random.seed(1)
+    check_steady()
+    check_jitter()
+    check_stall()
+    check_retry()
+    check_keyframes()
+    check_transit_jump()
+    check(pacing.pacers == [], 'making pacers registered %d of them' % len(pacing.pacers))
+
+    return checks.report('Output pacing checks')
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,210 @@
+#
+# Output pacing (MegaMosquito)
+#
+# The udpsink at the end of the pipeline can sync to the clock, or not (see
+# OUTPUT_SYNC). With sync, the output is regular, but every frame waits for
+# its time on the pipeline clock, and that slows the whole pipeline down.
+# Without sync, frames go out as fast as they come, and any hiccup upstream
+# (a slow inference, a busy encoder) comes out as a freeze followed by a
+# burst of frames, which viewers see as stuttering video.
+#
+# Pacing sits in between. A queue is added after the encoder (see
+# "_output" in "profiles.py"), which gives the frames after it their own
+# thread, and once the pipeline is built two probes on the queue run a Pacer
+# (see "pacing_arrival_probe" and "pacing_release_probe" in
+# deepstream-rtsp.py):
+#
+#   encoder --> [arrive] pacer-queue [depart] --> rtppay --> udpsink (sync=0)
+#
+# The Pacer is a small adaptive jitter buffer. For each frame it works out
+# the "transit" time, the time the frame arrived at the queue less its
+# presentation time stamp (PTS). It keeps a running mean of the transit
+# time, and of how much it varies (like RTP receivers do), and holds each
+# frame until:
+#
+#    release = PTS + mean transit + delay
+#
+# where "delay" is 4 times the variation, but no less than the minimum, and
+# no more than the maximum, delay. So the frames go out spaced as their
+# time stamps are (i.e., at the source frame rate) and the buffer only adds
+# as much delay as the jitter upstream needs. Only the queue's thread waits,
+# so the pipeline upstream keeps running at full speed.
+#
+# A frame that is more than one frame interval past its release time when it
+# gets to the front of the queue is dropped, instead of stalling everything
+# behind it. Dropping encoded frames breaks the frames that follow (they are
+# coded as differences from the dropped ones), so at the first drop of a
+# burst the encoder is asked for a keyframe, and the frames in between are
+# dropped too. Keyframes are never dropped.
+#
+# Each Pacer keeps counts of what it has done, and a running mean of the
+# output inter-frame jitter (how far the gaps between frames going out are
+# from the gaps between their time stamps). The jitter is measured from the
+# times the frames actually leave (see "released" below), after the wait,
+# so it includes any oversleeping, and any delay in getting the queue's
+# thread going again. See "snapshot" below.
+#
+# This module does not need Gstreamer, so it can be used, and checked (see
+# "pacing-test.py"), anywhere.
+#
+
+import collections
+
+
+# The pacers in use (for reporting, see "report" below). Whoever makes a
+# pacer for a running pipeline adds it here (see "main" in
+# deepstream-rtsp.py), so pacers made for anything else are not reported.
+pacers = []
+
+# PTS gaps longer than this (in seconds) are ignored by the frame interval
+# measurement (e.g., a source that has stalled and restarted)
+MAX_INTERVAL = 1.0
+
+# A jump in the transit time bigger than this (in seconds) restarts the
+# transit measurement (e.g., the time stamps have been reset)
+MAX_TRANSIT_JUMP = 2.0
+
+# How long to wait (in seconds) for a requested keyframe before asking again
+KEYFRAME_RETRY = 1.0
+
+
+class Pacer:
+
+    # "name" is used in reports. The delays are in seconds.
+    def __init__(self, name, min_delay=0.02, max_delay=0.2):
+        self.name = name
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        # Arrival times of the frames in the queue (oldest first)
+        self._arrivals = collections.deque()
+        # The source frame interval, measured from the PTS (seconds)
+        self.interval = None
+        self._last_pts = None
+        # Running mean of the transit time, and of its variation (seconds)
+        self._transit = None
+        self._variation = 0.0
+        self.delay = min_delay
+        # Keyframe resynchronization after drops
+        self._waiting_for_keyframe = False
+        self._requested_at = None
+        self._burst = 0
+        # Output statistics
+        self._sending = None
+        self._last_out = None
+        self._last_out_pts = None
+        self.jitter = 0.0
+        self.sent = 0
+        self.dropped_late = 0
+        self.dropped_resync = 0
+        self.bursts = 0
+        self.longest_burst = 0
+        self.keyframes_requested = 0
+
+    # A frame has arrived at the queue. This is called from the thread
+    # upstream of the queue.
+    def arrive(self, now):
+        self._arrivals.append(now)
+
+    #
+    # The oldest frame in the queue is about to leave it. This is called from
+    # the queue's thread. "pts" is the frame's time stamp in seconds (or None
+    # if it has none), "keyframe" is True if the frame is a keyframe, and
+    # "now" is the current time (on the same clock as for "arrive").
+    #
+    # Returns (wait, request_keyframe). "wait" is how long to hold the frame
+    # (in seconds) before sending it on, or None if it should be dropped. If
+    # "request_keyframe" is True, the caller should ask the encoder for a
+    # keyframe.
+    #
+    def depart(self, pts, keyframe, now):
+        arrival = self._arrivals.popleft() if self._arrivals else now
+        if pts is None:
+            # No time stamp, so assume it took the usual time to get here
+            pts = arrival - (self._transit or 0.0)
+
+        # Measure the source frame interval
+        if self._last_pts is not None:
+            gap = pts - self._last_pts
+            if 0.0 < gap < MAX_INTERVAL:
+                if self.interval is None:
+                    self.interval = gap
+                else:
+                    self.interval += (gap - self.interval) / 16.0
+        self._last_pts = pts
+
+        # Adapt the delay to the variation in the transit time
+        transit = arrival - pts
+        if self._transit is None or abs(transit - self._transit) > MAX_TRANSIT_JUMP:
+            self._transit = transit
+            self._variation = 0.0
+        else:
+            self._variation += (abs(transit - self._transit) - self._variation) / 16.0
+            self._transit += (transit - self._transit) / 16.0
+        self.delay = min(max(4.0 * self._variation, self.min_delay), self.max_delay)
+        release = pts + self._transit + self.delay
+
+        # Drop late frames (and the ones after them, up to a keyframe)
+        late = now - release > (self.interval or self.min_delay)
+        if not keyframe and (late or self._waiting_for_keyframe):
+            if late:
+                self.dropped_late += 1
+            else:
+                self.dropped_resync += 1
+            if not self._waiting_for_keyframe:
+                self._waiting_for_keyframe = True
+                request = True
+            else:
+                request = now - self._requested_at > KEYFRAME_RETRY
+            if request:
+                self._requested_at = now
+                self.keyframes_requested += 1
+            self._burst += 1
+            return None, request
+        if keyframe:
+            self._waiting_for_keyframe = False
+        if self._burst:
+            self.bursts += 1
+            self.longest_burst = max(self.longest_burst, self._burst)
+            self._burst = 0
+
+        # Send it at its release time (or now, if that has passed)
+        self._sending = pts
+        self.sent += 1
+        return max(0.0, release - now), False
+
+    # The frame "depart" said to send has actually left the queue, after
+    # its wait. This is called from the queue's thread, with the current
+    # time (on the same clock as for "depart").
+    def released(self, now):
+        pts = self._sending
+        if pts is None:
+            return
+        self._sending = None
+        if self._last_out is not None:
+            gap = pts - self._last_out_pts
+            # Gaps in the time stamps (e.g., from dropped frames) are allowed
+            # for, but not restarts of them
+            if 0.0 < gap < MAX_INTERVAL:
+                self.jitter += (abs(now - self._last_out - gap) - self.jitter) / 16.0
+        self._last_out = now
+        self._last_out_pts = pts
+
+    # The current state, and counts, of this pacer (times in milliseconds)
+    def snapshot(self):
+        return {
+            'name': self.name,
+            'fps': round(1.0 / self.interval, 2) if self.interval else 0.0,
+            'delay_ms': round(1000.0 * self.delay, 2),
+            'jitter_ms': round(1000.0 * self.jitter, 2),
+            'sent': self.sent,
+            'dropped_late': self.dropped_late,
+            'dropped_resync': self.dropped_resync,
+            'drop_bursts': self.bursts,
+            'longest_burst': self.longest_burst,
+            'keyframes_requested': self.keyframes_requested,
+        }
+
+
+# Return the snapshots of all of the pacers in use
+def report():
+    return [p.snapshot() for p in pacers]
@@ -0,0 +1,187 @@
+#
+# The inferencing metadata probe (MegaMosquito)
+#
+# This is the part of the "osd_sink_pad_buffer_probe" (see deepstream-rtsp.py)
+# that walks through the Deepstream metadata for each batch of frames. It is
+# in its own module, with no Gstreamer dependency, so it can also be run
+# without a GPU by substituting a stand-in for the "pyds" module (see
+# "fakepyds.py" and "soak-test.py").
+#
+
+import collections
+
+# Import the NVIDIA Deepstream Python bindings (or a stand-in for them)
+import pyds
+
+
+#
+# This is the "PGIE" inferencing example from the original NVIDIA Deepstream
+# example in
+#
+# This example detects these classes:
+#  - normal vehicles (cars, trucks, busses)
+#  - 2-wheeled vehicles (bicycles, mopeds, motorcycles)
+#  - people
+#  - road signs
+#
+PGIE_CLASS_ID_VEHICLE = 0
+PGIE_CLASS_ID_BICYCLE = 1
+PGIE_CLASS_ID_PERSON = 2
+PGIE_CLASS_ID_ROADSIGN = 3
+
+# The names of those classes, indexed by class id
+PGIE_CLASS_NAMES = ['vehicle', 'bicycle', 'person', 'roadsign']
+
+
+# Print the text for each frame on the terminal (set from SHOW_FRAMES)
+show_frames = True
+
+# The names of the secondary inference stages, by gie-unique-id (see
+# "secondary.py"), for the text drawn on each frame
+secondary_names = {}
+
+# Each object found in a frame is passed along to the frame hooks (below)
+# as one of these. The box is in pixels, in full frame streammux coordinates
+# (also for sources with a region of interest, see "roi.py").
+# "labels" has a (gie-unique-id, label) pair for each secondary inference
+# result attached to the object.
+Detection = collections.namedtuple('Detection', ['class_id', 'confidence', 'left', 'top', 'width', 'height', 'labels'])
+
+# Anything else that wants to see the results for each frame can add a
+# function to this list. Each one is called, in order, once per frame, as:
+#     hook(frame_meta, detections, obj_counter)
+# where "detections" is a list of the Detections in that frame, and
+# "obj_counter" holds the number of objects found in that frame for each
+# class id. The metadata is only valid during the call, so hooks must copy
+# out anything they want to keep, and they should be quick about it
+# because they run in the pipeline's streaming thread.
+frame_hooks = []
+
+
+#
+# Return a list of the (gie-unique-id, label) results attached to an object
+# by the secondary inference stages (if any).
+#
+def secondary_labels(obj_meta):
+    labels = []
+    l_class = obj_meta.classifier_meta_list
+    while l_class is not None:
+        try:
+            class_meta = pyds.NvDsClassifierMeta.cast(l_class.data)
+        except StopIteration:
+            break
+        l_label = class_meta.label_info_list
+        while l_label is not None:
+            try:
+                label_info = pyds.NvDsLabelInfo.cast(l_label.data)
+            except StopIteration:
+                break
+            labels.append((class_meta.unique_component_id, label_info.result_label))
+            try:
+                l_label = l_label.next
+            except StopIteration:
+                break
+        try:
+            l_class = l_class.next
+        except StopIteration:
+            break
+    return labels
+
+
+#
+# Process the metadata for one batch of frames.
+#
+def process_batch(batch_meta):
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        try:
+            # Note that l_frame.data needs a cast to pyds.NvDsFrameMeta
+            # The casting is done by pyds.NvDsFrameMeta.cast()
+            # The casting also keeps ownership of the underlying memory
+            # in the C code, so the Python garbage collector will leave
+            # it alone.
+            frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+        except StopIteration:
+            break
+
+        #Intiallizing object counter with 0.
+        obj_counter = {
+            PGIE_CLASS_ID_VEHICLE:0,
+            PGIE_CLASS_ID_PERSON:0,
+            PGIE_CLASS_ID_BICYCLE:0,
+            PGIE_CLASS_ID_ROADSIGN:0
+        }
+        # Counter for the secondary inference results, by (gie id, label)
+        label_counter = {}
+        detections = []
+        frame_number=frame_meta.frame_num
+        num_rects = frame_meta.num_obj_meta
+        l_obj=frame_meta.obj_meta_list
+        while l_obj is not None:
+            try:
+                # Casting l_obj.data to pyds.NvDsObjectMeta
+                obj_meta=pyds.NvDsObjectMeta.cast(l_obj.data)
+            except StopIteration:
+                break
+            obj_counter[obj_meta.class_id] += 1
+            labels = []
+            if obj_meta.classifier_meta_list is not None:
+                labels = secondary_labels(obj_meta)
+                for label in labels:
+                    label_counter[label] = label_counter.get(label, 0) + 1
+            if frame_hooks:
+                rect = obj_meta.rect_params
+                detections.append(Detection(obj_meta.class_id, obj_meta.confidence, rect.left, rect.top, rect.width, rect.height, tuple(labels)))
+            try:
+                l_obj=l_obj.next
+            except StopIteration:
+                break
+
+        # Acquiring a display meta object. The memory ownership remains in
+        # the C code so downstream plugins can still access it. Otherwise
+        # the garbage collector will claim it when this probe function exits.
+        display_meta=pyds.nvds_acquire_display_meta_from_pool(batch_meta)
+        display_meta.num_labels = 1
+        py_nvosd_text_params = display_meta.text_params[0]
+        # Setting display text to be shown on screen
+        # Note that the pyds module allocates a buffer for the string, and the
+        # memory will not be claimed by the garbage collector.
+        # Reading the display_text field here will return the C address of the
+        # allocated string. Use pyds.get_string() to get the string content.
+        text = "Frame={}  Objects={}  Vehicles={}  Cycles={}  Persons={}  Signs={}".format(frame_number, num_rects, obj_counter[PGIE_CLASS_ID_VEHICLE], obj_counter[PGIE_CLASS_ID_BICYCLE], obj_counter[PGIE_CLASS_ID_PERSON], obj_counter[PGIE_CLASS_ID_ROADSIGN])
+        # Add the secondary inference results, if any, e.g., "car-color: red=2 blue=1"
+        last_gie_id = None
+        for gie_id, label in sorted(label_counter):
+            if gie_id != last_gie_id:
+                text += "  {}:".format(secondary_names.get(gie_id, gie_id))
+                last_gie_id = gie_id
+            text += " {}={}".format(label, label_counter[(gie_id, label)])
+        py_nvosd_text_params.display_text = text
+
+        # Now set the offsets where the string should appear
+        py_nvosd_text_params.x_offset = 10
+        py_nvosd_text_params.y_offset = 12
+
+        # Font , font-color and font-size
+        py_nvosd_text_params.font_params.font_name = "Serif"
+        py_nvosd_text_params.font_params.font_size = 10
+        # set(red, green, blue, alpha); set to White
+        py_nvosd_text_params.font_params.font_color.set(1.0, 1.0, 1.0, 1.0)
+
+        # Text background color
+        py_nvosd_text_params.set_bg_clr = 1
+        # set(red, green, blue, alpha); set to Black
+        py_nvosd_text_params.text_bg_clr.set(0.0, 0.0, 0.0, 1.0)
+        # Using pyds.get_string() to get display_text as string
+        if show_frames:
+            print(pyds.get_string(py_nvosd_text_params.display_text))
+        pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
+
+        # Pass the results for this frame along to anyone else interested
+        for hook in frame_hooks:
+            hook(frame_meta, detections, obj_counter)
+
+        try:
+            l_frame=l_frame.next
+        except StopIteration:
+            break
@@ -0,0 +1,326 @@
+#
+# Pipeline profiles (MegaMosquito)
+#
+# Each profile is a function that returns a spec for the pipeline builder
+# (see "builder.py") from the settings given to it (see "settings" in
+# deepstream-rtsp.py). Choose one with PIPELINE_PROFILE:
+#
+#   full            (the default) all sources are inferenced, tiled into
+#                   one picture, annotated, encoded, and served as one
+#                   RTSP output stream:
+#
+#     sources -> streammux -> pgie [-> tracker -> sgies] -> convertor
+#       -> tiler -> osd -> convertor -> caps -> encoder [-> pacer-queue]
+#       -> rtppay -> udpsink
+#
+#   metadata-only   all sources are inferenced, and that's all. There is no
+#                   tiler, OSD, convertor, encoder or RTSP output. The probe
+#                   (and the exports hooked into it) still see everything.
+#                   Use this on hosts that only need the detections; it
+#                   frees all the GPU and CPU time the video output needs:
+#
+#     sources -> streammux -> pgie [-> tracker -> sgies] -> fakesink
+#
+#   per-camera      all sources are inferenced, then split up again, and
+#                   each is annotated, encoded and served as its own RTSP
+#                   output stream (RTSPOUTPUTPATH with the source number on
+#                   the end, e.g., /ds0, /ds1, ...):
+#
+#     sources -> streammux -> pgie [-> tracker -> sgies] -> demux
+#       -> (for each source) queue -> convertor -> osd -> convertor -> caps
+#            -> encoder [-> pacer-queue] -> rtppay -> udpsink
+#
+# Every profile returns the spec with an extra "outputs" entry: a list of
+# (UDP port, RTSP path) pairs, one for each RTSP output stream the pipeline
+# sends (the RTSP server setup in deepstream-rtsp.py uses these), and an
+# extra "pacers" entry: a list of (queue name, RTSP path) pairs, one for
+# each paced output (deepstream-rtsp.py makes a pacing.Pacer for each, once
+# the pipeline is built, and attaches it to the queue).
+#
+# This module does not need Gstreamer or Deepstream, so the specs can be
+# checked with "builder.validate" anywhere.
+#
+# To add another kind of output (e.g., to the screen, with nveglglessink)
+# write another profile function and add it to PROFILES at the bottom.
+#
+
+
+#
+# The settings each profile expects (a dict). These come from the process
+# environment (see deepstream-rtsp.py), except for the functions:
+#
+#   sources         list of functions, each making one source bin
+#   probe           the pad probe callback (osd_sink_pad_buffer_probe)
+#   config_file     the PGIE's nvinfer config file (CONFIG_FILE)
+#   stages          list of (secondary.Stage, config file path) pairs
+#   aarch64         True on NVIDIA Jetson hardware
+#   mem_type        the nvbuf-memory-type to use (None for the default)
+#   mux_width, mux_height, output_width, output_height
+#   codec, bitrate, preset_level, output_queue, output_sync
+#   software_encoder  True to encode on the CPU (x264enc/x265enc)
+#   output_pacing   True to pace the outputs (see "pacing.py")
+#   tracker_lib, udp_host, udp_port, rtsp_path
+#
+
+
+#
+# The elements common to all profiles: the sources, the streammux, and the
+# inferencing. Returns (elements, links, name of the last element).
+#
+def _inference(s):
+    elements = []
+    links = []
+
+    # The first "source elements" in the pipeline are the source "bins" (see
+    # "create_source_bin" in deepstream-rtsp.py). They are multiplexed into
+    # batches by the streammux element, something like this:
+    #
+    #  +-------------+   +-------------------+
+    #  | stream0-bin +-->|sink-pad           |
+    #  +-------------+   |                   |
+    #                    |                   |   +--------------+
+    #         ...        | streammux-element +-->| next-element +--> ...
+    #                    |                   |   +--------------+
+    #  +-------------+   |                   |
+    #  | streamN-bin +-->|sink-pad           |
+    #  +-------------+   +-------------------+
+    #
+    mux = {
+        'width': s['mux_width'],
+        'height': s['mux_height'],
+        'batch-size': 1,
+        'batched-push-timeout': 4000000,
+    }
+    if s['mem_type'] is not None:
+        # Use CUDA unified memory in the pipeline so frames
+        # can be easily accessed on CPU in Python.
+        mux['nvbuf-memory-type'] = s['mem_type']
+    elements.append({ 'name': 'Stream-muxer', 'factory': 'nvstreammux', 'properties': mux })
+    for i in range(len(s['sources'])):
+        name = 'source-bin-%02d' % i
+        elements.append({ 'name': name, 'make': s['sources'][i] })
+        links.append((name, 'Stream-muxer.sink_%d' % i))
+
+    # The next element in the pipeline does the inferencing (on the GPU). Its
+    # configuration comes from the CONFIG_FILE (see deepstream-rtsp.py).
+    elements.append({ 'name': 'primary-inference', 'factory': 'nvinfer', 'properties': { 'config-file-path': s['config_file'] } })
+    links.append(('Stream-muxer', 'primary-inference'))
+    last = 'primary-inference'
+
+    # Optionally, secondary inference stages (see "secondary.py"). They run
+    # in asynchronous mode, which needs the objects to be tracked from frame
+    # to frame, so they are preceded by a tracker.
+    if s['stages']:
+        elements.append({ 'name': 'tracker', 'factory': 'nvtracker', 'properties': {
+            'll-lib-file': s['tracker_lib'],
+            'tracker-width': 640,
+            'tracker-height': 384,
+            'gpu-id': 0,
+            'enable-batch-process': 1,
+        }})
+        links.append((last, 'tracker'))
+        last = 'tracker'
+        for stage, config_path in s['stages']:
+            name = 'secondary-inference-%s' % stage.name
+            elements.append({ 'name': name, 'factory': 'nvinfer', 'properties': { 'config-file-path': config_path } })
+            links.append((last, name))
+            last = name
+
+    return elements, links, last
+
+
+#
+# The elements that draw on, encode and send one output video stream, from
+# the OSD on. "suffix" is added to all their names. Returns (elements,
+# links, pacers, name of the first element).
+#
+def _output(s, suffix, udp_port, rtsp_path):
+    elements = []
+    links = []
+    pacers = []
+
+    # The OSD element draws the boxes (and the text added by the probe) and
+    # requires RGBA input. It is followed by a convertor to get back to a
+    # format (I420, enforced by the caps filter) the encoder can take. The
+    # software encoders need it in ordinary (not NVMM) memory.
+    caps = 'video/x-raw, format=I420' if s['software_encoder'] else 'video/x-raw(memory:NVMM), format=I420'
+    elements.append({ 'name': 'onscreendisplay' + suffix, 'factory': 'nvdsosd' })
+    elements.append({ 'name': 'convertor_postosd' + suffix, 'factory': 'nvvideoconvert' })
+    elements.append({ 'name': 'filter' + suffix, 'factory': 'capsfilter', 'properties': { 'caps': caps } })
+    links.append(('onscreendisplay' + suffix, 'convertor_postosd' + suffix))
+    links.append(('convertor_postosd' + suffix, 'filter' + suffix))
+    last = 'filter' + suffix
+
+    # Optionally, put a queue in front of the encoder. This gives the encoder
+    # its own thread, so it can work in parallel with the elements upstream
+    # of it. It also adds buffering, and that may add latency. Use the
+    # latency-test.py tool to see what it does on your hardware.
+    if s['output_queue'] > 0:
+        elements.append({ 'name': 'encoder-queue' + suffix, 'factory': 'queue', 'properties': {
+            'max-size-buffers': s['output_queue'],
+            'max-size-bytes': 0,
+            'max-size-time': 0,
+        }})
+        links.append((last, 'encoder-queue' + suffix))
+        last = 'encoder-queue' + suffix
+
+    # The encoder (H264 or H265). Normally this is the hardware (v4l2)
+    # encoder. The software encoders are for hosts without one, and for
+    # trying things out (e.g., pacing) on localhost.
+    codec = 'h265' if 'H265' == s['codec'] else 'h264'
+    rtppay = {}
+    if s['software_encoder']:
+        encoder = {
+            'bitrate': int(s['bitrate']) // 1000, # kbit/s
+            'tune': 4,                            # zerolatency
+            'speed-preset': 1,                    # ultrafast
+            'key-int-max': 30,
+        }
+        factory = 'x%senc' % codec[1:]
+        # Send the parameter sets with every keyframe, so clients can join
+        rtppay['config-interval'] = -1
+    else:
+        encoder = { 'bitrate': int(s['bitrate']) }
+        if s['aarch64']:
+            encoder['preset-level'] = s['preset_level']
+            encoder['insert-sps-pps'] = 1
+            encoder['bufapi-version'] = 1
+        factory = 'nvv4l2%senc' % codec
+    elements.append({ 'name': 'encoder' + suffix, 'factory': factory, 'properties': encoder })
+    links.append((last, 'encoder' + suffix))
+    last = 'encoder' + suffix
+
+    # Optionally, pace the output (see "pacing.py"). The queue gives the
+    # pacing its own thread. It must be able to hold more than the largest
+    # pacing delay (late frames are dropped, so it doesn't fill up).
+    if s['output_pacing']:
+        elements.append({ 'name': 'pacer-queue' + suffix, 'factory': 'queue', 'properties': {
+            'max-size-buffers': 0,
+            'max-size-bytes': 0,
+            'max-size-time': 2000000000, # 2 seconds
+        }})
+        links.append((last, 'pacer-queue' + suffix))
+        pacers.append(('pacer-queue' + suffix, rtsp_path))
+        last = 'pacer-queue' + suffix
+
+    # Encapsulate the video into RTP packets, and send them to a local
+    # multicast UDP port, where the RTSP server picks them up (see the
+    # GstRtspServer in deepstream-rtsp.py)
+    elements.append({ 'name': 'rtppay' + suffix, 'factory': 'rtp%spay' % codec, 'properties': rtppay })
+    links.append((last, 'rtppay' + suffix))
+    elements.append({ 'name': 'udpsink' + suffix, 'factory': 'udpsink', 'properties': {
+        'host': s['udp_host'],
+        'port': udp_port,
+        'async': False,
+        # Sync to a clock (1) or don't sync (0). I find that using 1 slows
+        # things down, but it seems much more regular. When I use 0 it is
+        # much faster but it freezes intermittently. Output pacing (see
+        # OUTPUT_PACING) aims to be regular without the slow down. Use
+        # latency-test.py to put some numbers on the differences.
+        'sync': s['output_sync'],
+    }})
+    links.append(('rtppay' + suffix, 'udpsink' + suffix))
+
+    return elements, links, pacers, 'onscreendisplay' + suffix
+
+
+def full(s):
+    elements, links, last = _inference(s)
+
+    # Convert to RGBA (as required by the OSD). The probe goes on the input
+    # of this convertor, where all of the inferencing metadata is available.
+    convertor = {}
+    tiler = {
+        'width': s['output_width'],
+        'height': s['output_height'],
+    }
+    if s['mem_type'] is not None:
+        convertor['nvbuf-memory-type'] = s['mem_type']
+        tiler['nvbuf-memory-type'] = s['mem_type']
+    elements.append({ 'name': 'convertor', 'factory': 'nvvideoconvert', 'properties': convertor })
+    links.append((last, 'convertor'))
+
+    # Tile the sources into one picture (as square as possible)
+    number_of_sources = len(s['sources'])
+    rows = int(number_of_sources ** 0.5)
+    tiler['rows'] = rows
+    tiler['columns'] = (number_of_sources + rows - 1) // rows
+    elements.append({ 'name': 'nvtiler', 'factory': 'nvmultistreamtiler', 'properties': tiler })
+    links.append(('convertor', 'nvtiler'))
+
+    output_elements, output_links, pacers, first = _output(s, '', s['udp_port'], s['rtsp_path'])
+    elements += output_elements
+    links += output_links
+    links.append(('nvtiler', first))
+
+    return {
+        'elements': elements,
+        'links': links,
+        'probes': [('convertor.sink', s['probe'])],
+        'outputs': [(s['udp_port'], s['rtsp_path'])],
+        'pacers': pacers,
+    }
+
+
+def metadata_only(s):
+    elements, links, last = _inference(s)
+
+    # Send the batches nowhere (the "fake" sink) once the probe has seen them
+    elements.append({ 'name': 'fakesink', 'factory': 'fakesink', 'properties': {
+        'sync': 0,
+        'async': False,
+    }})
+    links.append((last, 'fakesink'))
+
+    return {
+        'elements': elements,
+        'links': links,
+        'probes': [('fakesink.sink', s['probe'])],
+        'outputs': [],
+        'pacers': [],
+    }
+
+
+def per_camera(s):
+    elements, links, last = _inference(s)
+
+    # Split the batches back up into one stream per source. The probe goes
+    # on the input of the demux, where all of the metadata is available.
+    elements.append({ 'name': 'demux', 'factory': 'nvstreamdemux' })
+    links.append((last, 'demux'))
+
+    outputs = []
+    pacers = []
+    for i in range(len(s['sources'])):
+        suffix = '-%02d' % i
+        # Each stream gets its own thread (queue) and RGBA convertor (for
+        # the OSD), then its own output
+        convertor = {}
+        if s['mem_type'] is not None:
+            convertor['nvbuf-memory-type'] = s['mem_type']
+        elements.append({ 'name': 'queue' + suffix, 'factory': 'queue' })
+        elements.append({ 'name': 'convertor' + suffix, 'factory': 'nvvideoconvert', 'properties': convertor })
+        links.append(('demux.src_%d' % i, 'queue' + suffix))
+        links.append(('queue' + suffix, 'convertor' + suffix))
+        rtsp_path = '%s%d' % (s['rtsp_path'], i)
+        output_elements, output_links, output_pacers, first = _output(s, suffix, s['udp_port'] + i, rtsp_path)
+        elements += output_elements
+        links += output_links
+        pacers += output_pacers
+        links.append(('convertor' + suffix, first))
+        outputs.append((s['udp_port'] + i, rtsp_path))
+
+    return {
+        'elements': elements,
+        'links': links,
+        'probes': [('demux.sink', s['probe'])],
+        'outputs': outputs,
+        'pacers': pacers,
+    }
+
+
+PROFILES = {
+    'full': full,
+    'metadata-only': metadata_only,
+    'per-camera': per_camera,
+}
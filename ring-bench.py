@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+#
+# Throughput benchmark for the shared memory detection ring (MegaMosquito)
+#
+# One writer process publishes synthetic detections into a ring (see
+# "shmring.py") as fast as it can, while several reader processes read them
+# as fast as they can. At the end, each reports how many records per second
+# it managed, and each reader also reports how many records it missed by
+# falling behind. No GPU or Deepstream is needed, e.g.:
+#
+#    BENCH_READERS=4 BENCH_SECONDS=10 python3 ring-bench.py
+#
+# By default the writer runs flat out, which is much faster than any real
+# pipeline, so readers may fall behind. Set BENCH_RATE (frames per second)
+# to publish at a more realistic rate instead.
+#
+# Set BENCH_SLOW_READER to make the last reader sleep for that many seconds
+# between reads, to see a slow reader fall behind (without slowing anyone
+# else down).
+#
+
+# Basic dependencies
+import os
+import sys
+import time
+import tempfile
+import collections
+import multiprocessing
+
+
+# Configuration from the process environment (see "environment.py")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from environment import get_from_env
+BENCH_READERS = int(get_from_env('BENCH_READERS', '4')) # Number of reader processes
+BENCH_SECONDS = float(get_from_env('BENCH_SECONDS', '10')) # Length of the run
+BENCH_RING_SIZE = int(get_from_env('BENCH_RING_SIZE', '65536')) # Records in the ring
+BENCH_BATCH = int(get_from_env('BENCH_BATCH', '20')) # Detections per published frame
+BENCH_SLOW_READER = float(get_from_env('BENCH_SLOW_READER', '0')) # Sleep (s) for the last reader
+BENCH_RATE = float(get_from_env('BENCH_RATE', '0')) # Writer frames/s (0 = flat out)
+
+import shmring
+
+# The same fields as "Detection" in probe.py (which needs pyds to import)
+Detection = collections.namedtuple('Detection', ['class_id', 'confidence', 'left', 'top', 'width', 'height', 'labels'])
+
+
+def writer(path, ready, go, results):
+    ring = shmring.RingWriter(path, BENCH_RING_SIZE)
+    detections = [Detection(i % 4, 0.5, 10.0 * i, 20.0, 100.0, 200.0, ()) for i in range(BENCH_BATCH)]
+    ready.set()
+    go.wait()
+    frame_num = 0
+    start = time.time()
+    end = start + BENCH_SECONDS
+    next_frame = start
+    while time.time() < end:
+        if BENCH_RATE > 0:
+            now = time.time()
+            if next_frame > now:
+                time.sleep(next_frame - now)
+            next_frame += 1.0 / BENCH_RATE
+        ring.publish(0, frame_num, detections)
+        frame_num += 1
+    elapsed = time.time() - start
+    results.put(('writer', ring.seq, 0, elapsed))
+    ring.close()
+
+def reader(index, path, ready, go, results):
+    ready.wait()
+    ring = shmring.RingReader(path)
+    slow = BENCH_SLOW_READER if index == BENCH_READERS - 1 else 0
+    go.wait()
+    count = 0
+    start = time.time()
+    end = start + BENCH_SECONDS
+    while time.time() < end:
+        records = ring.read()
+        count += len(records)
+        if slow > 0:
+            time.sleep(slow)
+    elapsed = time.time() - start
+    results.put(('reader %d' % index, count, ring.dropped, elapsed))
+    ring.close()
+
+
+def main(args):
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    path = os.path.join(directory, 'slipstream-ring-bench.%d' % os.getpid())
+    ready = multiprocessing.Event()
+    go = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=writer, args=(path, ready, go, results))]
+    for i in range(BENCH_READERS):
+        procs.append(multiprocessing.Process(target=reader, args=(i, path, ready, go, results)))
+    for p in procs:
+        p.start()
+    # Give the readers a moment to open the ring, then start everyone
+    ready.wait()
+    time.sleep(1)
+    go.set()
+    reports = [results.get() for p in procs]
+    for p in procs:
+        p.join()
+    os.remove(path)
+
+    print('Ring: %d records of %d bytes, %d detections per frame, %d readers, %ds' % (BENCH_RING_SIZE, shmring.RECORD_SIZE, BENCH_BATCH, BENCH_READERS, BENCH_SECONDS))
+    for name, count, dropped, elapsed in sorted(reports):
+        print('  %-10s  %12.0f records/s  (%d records, %d dropped)' % (name, count / elapsed, count, dropped))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
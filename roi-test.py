@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+#
+# Region of interest checks (MegaMosquito)
+#
+# This checks the regions of interest (see "roi.py") with synthetic boxes,
+# and no Gstreamer (see "checks.py"):
+#
+#    python3 roi-test.py
+#
+# For each of a few ROIs, and each of a few source frame sizes, it checks
+# the rectangle kept (in source pixels, see "Roi.crop"): that it is on even
+# pixels, within the frame, and covers the ROI, and that the properties for
+# nvvideoconvert, and for videocrop and videobox, keep it in its place in a
+# frame of the same size. Random synthetic boxes, in full frame coordinates,
+# are then put through what the pipeline does to them: scaled to source
+# pixels, cut to the rectangle kept, and scaled up to the streammux frame.
+# Boxes inside the ROI must come through unchanged, boxes outside it must
+# be gone, and those across its edge must be cut at the edge. The boxes that
+# come through are given to the probe (see "probe.py"), through the pyds
+# stand-in (see "fakepyds.py"), and the detections it passes to the frame
+# hooks, and the object metadata (which the OSD draws), must be the same
+# boxes. The parsing of ROI settings is checked too. The exit status is 0 if
+# all checks pass.
+#
+
+# Basic dependencies
+import os
+import sys
+import random
+
+
+# Use the stand-in for the Deepstream Python bindings
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import fakepyds
+sys.modules['pyds'] = fakepyds
+import probe
+import roi
+from checks import check
+import checks
+
+MUX_WIDTH = 1920
+MUX_HEIGHT = 1080
+
+# (left, top, width, height) in full frame streammux coordinates
+ROIS = [
+    (0, 0, 1920, 1080),       # The whole frame
+    (0, 540, 1920, 540),      # The bottom half (a band of road)
+    (480, 270, 960, 540),     # The middle
+    (660, 0, 600, 1080),      # A tall strip (a doorway)
+    (101, 57, 333, 211),      # Odd sizes, that don't crop to whole pixels
+    (1918, 1078, 2, 2),       # The smallest, in the corner
+]
+
+# (width, height) of the source frames
+SOURCE_SIZES = [(1920, 1080), (1280, 720), (640, 480), (3840, 2160), (1366, 768)]
+
+# How close (in streammux pixels) the boxes must come through
+TOLERANCE = 0.001
+
+BOXES = 20
+
+# Put a full frame box through the pipeline: to source pixels, cut to
+# "crop" (source pixels, everything else is blanked out), and scaled up to
+# the streammux frame. Returns None if nothing of it is left.
+def through_pipeline(box, crop, source_width, source_height):
+    left, top, width, height = box
+    sx = source_width / float(MUX_WIDTH)
+    sy = source_height / float(MUX_HEIGHT)
+    cleft, ctop, cwidth, cheight = crop
+    l = max(left * sx, cleft)
+    t = max(top * sy, ctop)
+    r = min((left + width) * sx, cleft + cwidth)
+    b = min((top + height) * sy, ctop + cheight)
+    if r <= l or b <= t:
+        return None
+    return (l / sx, t / sy, (r - l) / sx, (b - t) / sy)
+
+
+# A random box, inside the rectangle "kept"
+def random_box(kept):
+    kleft, ktop, kwidth, kheight = kept
+    width = random.uniform(0.01, 1.0) * kwidth
+    height = random.uniform(0.01, 1.0) * kheight
+    left = kleft + random.uniform(0, kwidth - width)
+    top = ktop + random.uniform(0, kheight - height)
+    return (left, top, width, height)
+
+
+def same(a, b):
+    return a is not None and b is not None and all(abs(x - y) <= TOLERANCE for x, y in zip(a, b))
+
+
+def check_crop(r, source_width, source_height):
+    name = '%s, %dx%d source' % (r, source_width, source_height)
+    crop = r.crop(source_width, source_height)
+    left, top, width, height = crop
+    check(left % 2 == 0 and top % 2 == 0 and width % 2 == 0 and height % 2 == 0, '%s: crop %s is not on even pixels' % (name, crop))
+    check(left >= 0 and top >= 0 and width > 0 and height > 0 and left + width <= source_width and top + height <= source_height, '%s: crop %s is not within the source frame' % (name, crop))
+    check(roi.src_crop(crop) == '%d:%d:%d:%d' % crop, '%s: src-crop "%s" does not match crop %s' % (name, roi.src_crop(crop), crop))
+    # videocrop, then videobox, must give a frame of the same size, with the
+    # crop where it was
+    v = roi.videocrop(crop, source_width, source_height)
+    check((v['left'], v['top'], source_width - v['left'] - v['right'], source_height - v['top'] - v['bottom']) == crop, '%s: videocrop %s does not match crop %s' % (name, v, crop))
+    b = roi.videobox(crop, source_width, source_height)
+    check(all(b[edge] <= 0 for edge in b), '%s: videobox %s crops' % (name, b))
+    check((-b['left'], -b['top'], width - b['left'] - b['right'], height - b['top'] - b['bottom']) == (left, top, source_width, source_height), '%s: videobox %s does not put crop %s back in its place' % (name, b, crop))
+    # The crop must cover the ROI to within a source pixel (or two, where
+    # the edges are rounded to even pixels) on each edge
+    kept = r.kept(source_width, source_height)
+    kleft, ktop, kwidth, kheight = kept
+    px = 2.0 * MUX_WIDTH / source_width
+    py = 2.0 * MUX_HEIGHT / source_height
+    check(abs(kleft - r.left) <= px and abs(kleft + kwidth - r.left - r.width) <= px and abs(ktop - r.top) <= py and abs(ktop + kheight - r.top - r.height) <= py, '%s: the crop %s is too far from the ROI (%s)' % (name, crop, kept))
+    return crop, kept
+
+
+def check_boxes(r, source_width, source_height):
+    name = '%s, %dx%d source' % (r, source_width, source_height)
+    crop, kept = check_crop(r, source_width, source_height)
+    kleft, ktop, kwidth, kheight = kept
+
+    # Boxes inside the ROI come through unchanged
+    inside = [random_box(kept) for i in range(BOXES)]
+    for box in inside:
+        seen = through_pipeline(box, crop, source_width, source_height)
+        check(same(box, seen), '%s: box %s, inside the ROI, was detected at %s' % (name, box, seen))
+    # Boxes outside it are gone
+    outside = []
+    if kleft > 1.0:
+        outside.append((0.0, ktop, kleft - 1.0, kheight))
+    if ktop + kheight < MUX_HEIGHT - 1.0:
+        outside.append((kleft, ktop + kheight + 1.0, kwidth, MUX_HEIGHT - ktop - kheight - 1.0))
+    for box in outside:
+        seen = through_pipeline(box, crop, source_width, source_height)
+        check(seen is None, '%s: box %s, outside the ROI, was detected at %s' % (name, box, seen))
+    # And the whole frame is cut to the ROI
+    seen = through_pipeline((0.0, 0.0, float(MUX_WIDTH), float(MUX_HEIGHT)), crop, source_width, source_height)
+    check(same(kept, seen), '%s: the whole frame was detected at %s, should be %s' % (name, seen, kept))
+
+    # Through the probe, which must pass the boxes on as they are in the
+    # metadata, for the sources with an ROI and without
+    objects = []
+    for box in inside:
+        objects.append((random.randint(0, 3), random.random()) + through_pipeline(box, crop, source_width, source_height))
+    batch = fakepyds.make_batch([(7, 0, objects), (3, 0, objects)])
+    results = {}
+    def hook(frame_meta, detections, obj_counter):
+        results[frame_meta.source_id] = detections
+    probe.frame_hooks[:] = [hook]
+    probe.process_batch(batch)
+    for source_id in [7, 3]:
+        detections = results.get(source_id, [])
+        check(len(detections) == len(inside), '%s: the probe passed on %d detections from source %d, should be %d' % (name, len(detections), source_id, len(inside)))
+        for box, o, d in zip(inside, objects, detections):
+            check(same(box, d[2:6]), '%s: the probe passed on box %s as %s' % (name, box, d[2:6]))
+            check((o[0], o[1]) == (d.class_id, d.confidence), '%s: the probe changed the class or confidence of %s' % (name, o))
+    for f in batch.frames:
+        l_obj = f.obj_meta_list
+        for o in objects:
+            rect = l_obj.data.rect_params
+            check((rect.left, rect.top, rect.width, rect.height) == tuple(o[2:]), '%s: the probe changed the object metadata' % name)
+            l_obj = l_obj.next
+    fakepyds.release_batch(batch)
+
+
+def check_parse():
+    rois = roi.parse('0:0,540,1920,540; 2:480,270,960,540', 3)
+    check(sorted(rois) == [0, 2], 'parse: wrong sources %s' % sorted(rois))
+    check((rois[2].left, rois[2].top, rois[2].width, rois[2].height) == (480, 270, 960, 540), 'parse: wrong ROI %s' % rois[2])
+    check(roi.parse('', 3) == {}, 'parse: an empty setting should give no ROIs')
+    for bad in ['0:0,0,1920', '0=0,0,10,10', 'x:0,0,10,10', '3:0,0,10,10', '0:0,0,10,10;0:0,0,20,20', '0:1900,0,40,10', '0:0,0,0,10', '0:-2,0,10,10']:
+        try:
+            roi.parse(bad, 3)
+            check(False, 'parse: "%s" should be rejected' % bad)
+        except ValueError:
+            pass
+
+
+def main(args):
+    random.seed(1)
+    probe.show_frames = False
+    check_parse()
+    for rect in ROIS:
+        for source_width, source_height in SOURCE_SIZES:
+            check_boxes(roi.Roi(*rect), source_width, source_height)
+    check(fakepyds.outstanding() == 0, 'the probe left %d stand-in "C" allocations' % fakepyds.outstanding())
+
+    return checks.report('Region of interest checks', '%d ROIs, %d source sizes' % (len(ROIS), len(SOURCE_SIZES)))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
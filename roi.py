@@ -0,0 +1,136 @@
+#
+# Per-source regions of interest (MegaMosquito)
+#
+# On many cameras only part of the picture matters (e.g., a band of road, or
+# a doorway). A region of interest (ROI) can be set for any source (see ROI
+# in deepstream-rtsp.py), and then only that part of the picture from that
+# source is inferenced. The rest of each frame is blanked out before the
+# streammux element, so objects outside the ROI can't be detected at all
+# (and there are no false positives there).
+#
+# Each ROI is given as a rectangle in full frame streammux coordinates,
+# i.e., in pixels of the 1920x1080 frames the streammux element makes from
+# each source (the same coordinates the detections are in when there is no
+# ROI). Since the size of the source's frames is not known until it is
+# decoded, the rectangle (in source pixels) is worked out then (see
+# "Roi.crop"). The frames are cropped to it, and the crop is put straight
+# back where it came from, in a blank frame of the same size:
+#
+#   source frame --> keep only the ROI --> streammux (scale to 1920x1080)
+#     (W x H)          (still W x H)
+#
+# So the frames reach the streammux element the same size, and are scaled
+# just like those of any other source, and the ROI ends up exactly where it
+# was in the full frame. Everything downstream (the detector, the tracker,
+# the secondary inference stages and their size gates, the OSD, the probe,
+# and the frame hooks) works in full frame coordinates, as usual, and there
+# is nothing to map back. The output video shows the ROI in its place, with
+# the rest of the frame blank.
+#
+# Note that the detector still gets the whole (mostly blank) frame, so an
+# ROI doesn't make inference any cheaper, or give the ROI any more of the
+# detector's input resolution. What it saves is the false positives (and
+# the tracking, secondary inference and exports for them) outside the ROI.
+#
+# This is done on the GPU for the RTSP sources (an nvvideoconvert with the
+# same "src-crop" and "dest-crop"), and on the CPU for the synthetic sources,
+# whose frames are made in ordinary memory (a videocrop, and then a videobox
+# to put the borders back). See "create_source_bin" and
+# "create_synthetic_source_bin" in deepstream-rtsp.py.
+#
+# This module does not need Gstreamer or Deepstream. See "roi-test.py" for
+# checks of the coordinates.
+#
+
+
+class Roi:
+
+    # The rectangle (in pixels) in full frame streammux coordinates, for
+    # streammux frames of "mux_width" by "mux_height"
+    def __init__(self, left, top, width, height, mux_width=1920, mux_height=1080):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.mux_width = mux_width
+        self.mux_height = mux_height
+
+    def __repr__(self):
+        return 'Roi(%d, %d, %d, %d)' % (self.left, self.top, self.width, self.height)
+
+    #
+    # Return the rectangle to keep, (left, top, width, height) in source
+    # pixels, for a source with frames of "source_width" by "source_height".
+    # The edges are rounded to even numbers of pixels (the chroma planes of
+    # the 4:2:0 formats used have half the resolution).
+    #
+    def crop(self, source_width, source_height):
+        sx = source_width / float(self.mux_width)
+        sy = source_height / float(self.mux_height)
+        def even(v, limit):
+            return min(limit, max(0, 2 * int(round(v / 2.0))))
+        left = even(self.left * sx, source_width - 2)
+        top = even(self.top * sy, source_height - 2)
+        right = max(left + 2, even((self.left + self.width) * sx, source_width))
+        bottom = max(top + 2, even((self.top + self.height) * sy, source_height))
+        return left, top, right - left, bottom - top
+
+    # The rectangle "crop" keeps, for the same source, in full frame
+    # streammux coordinates (i.e., the ROI, to within the rounding)
+    def kept(self, source_width, source_height):
+        left, top, width, height = self.crop(source_width, source_height)
+        sx = self.mux_width / float(source_width)
+        sy = self.mux_height / float(source_height)
+        return (left * sx, top * sy, width * sx, height * sy)
+
+
+# A crop (see "Roi.crop"), as the "src-crop" and "dest-crop" properties of
+# nvvideoconvert want it
+def src_crop(crop):
+    return '%d:%d:%d:%d' % crop
+
+
+# A crop (see "Roi.crop"), as the properties of videocrop (pixels to remove
+# from each edge of the source's frames)
+def videocrop(crop, source_width, source_height):
+    left, top, width, height = crop
+    return {
+        'left': left,
+        'top': top,
+        'right': source_width - left - width,
+        'bottom': source_height - top - height,
+    }
+
+
+# And as the properties of the videobox that puts the borders back, blank,
+# after the videocrop (negative values add pixels to each edge)
+def videobox(crop, source_width, source_height):
+    return dict([(edge, -pixels) for edge, pixels in videocrop(crop, source_width, source_height).items()])
+
+
+#
+# Parse the ROIs from "text" (see ROI in deepstream-rtsp.py). That is a list
+# of "source:left,top,width,height" entries, separated by ";", e.g.:
+#
+#    0:0,540,1920,540;2:480,270,960,540
+#
+# Returns a dict of Rois, by source id. Raises ValueError if anything is
+# wrong with it.
+#
+def parse(text, num_sources, mux_width=1920, mux_height=1080):
+    rois = {}
+    for entry in [e.strip() for e in text.split(';') if '' != e.strip()]:
+        try:
+            source, rect = entry.split(':')
+            source_id = int(source)
+            left, top, width, height = [int(v) for v in rect.split(',')]
+        except ValueError:
+            raise ValueError('ROI "%s" should be "source:left,top,width,height"' % entry)
+        if source_id < 0 or source_id >= num_sources:
+            raise ValueError('ROI "%s" is for source %d, but there are only %d sources' % (entry, source_id, num_sources))
+        if source_id in rois:
+            raise ValueError('ROI "%s": source %d already has an ROI' % (entry, source_id))
+        if width < 2 or height < 2 or left < 0 or top < 0 or left + width > mux_width or top + height > mux_height:
+            raise ValueError('ROI "%s" is not within the %dx%d frame' % (entry, mux_width, mux_height))
+        rois[source_id] = Roi(left, top, width, height, mux_width, mux_height)
+    return rois
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+#
+# Secondary inference checks (MegaMosquito)
+#
+# This checks the secondary inference stages (see "secondary.py"), with the
+# pyds stand-in (see "checks.py"):
+#
+#    python3 secondary-test.py
+#
+# It checks:
+#   - the gating ("Stage.accepts"), right at the class and size limits
+#   - the nvinfer config files generated for the stages ("write_config")
+#   - the gie-unique-ids given out by "load_stages", and that it rejects
+#     ones already in use
+#   - that the secondary results the probe (see "probe.py") counts, and adds
+#     to the text drawn on each frame, match the results the stand-in
+#     classifiers (see "StandInClassifier" in "fakepyds.py") attached
+#
+# The exit status is 0 if all checks pass.
+#
+
+# Basic dependencies
+import os
+import sys
+import random
+import tempfile
+import configparser
+
+
+# Use the stand-in for the Deepstream Python bindings
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import fakepyds
+sys.modules['pyds'] = fakepyds
+import probe
+import secondary
+from checks import check
+import checks
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'secondary-inference.cfg')
+
+FRAMES = 50
+
+def check_gating():
+    stage = secondary.Stage('test', 2, {
+        'operate-on-class-ids': '0;2',
+        'input-object-min-width': '64',
+        'input-object-min-height': '32',
+    })
+    # (class id, width, height, accepted?)
+    cases = [
+        (0, 64, 32, True),      # Exactly at the limits
+        (2, 64, 32, True),
+        (0, 63.9, 32, False),   # Just too narrow
+        (0, 64, 31.9, False),   # Just too short
+        (0, 1920, 1080, True),
+        (1, 1920, 1080, False), # Not one of the classes
+        (3, 64, 32, False),
+    ]
+    for class_id, width, height, expected in cases:
+        check(stage.accepts(class_id, width, height) == expected, 'gating: class %d, %sx%s should be %s' % (class_id, width, height, 'accepted' if expected else 'rejected'))
+    # With no gating set, everything is accepted
+    anything = secondary.Stage('anything', 3, {})
+    for class_id, width, height, expected in cases:
+        check(anything.accepts(class_id, width, height), 'gating: a stage with no gating should accept class %d, %sx%s' % (class_id, width, height))
+
+
+def check_configs(directory):
+    stages = secondary.load_stages(CONFIG_FILE, 'car-color, vehicle-type')
+    check([s.name for s in stages] == ['car-color', 'vehicle-type'], 'load_stages: the stages are not in the order asked for: %s' % [s.name for s in stages])
+    check([s.gie_id for s in stages] == [secondary.PGIE_UNIQUE_ID + 1, secondary.PGIE_UNIQUE_ID + 2], 'load_stages: the gie-unique-ids given out are %s' % [s.gie_id for s in stages])
+    for stage in stages:
+        path = stage.write_config(directory)
+        config = configparser.ConfigParser()
+        config.optionxform = str
+        config.read(path)
+        p = config['property'] if config.has_section('property') else {}
+        expected = {
+            'process-mode': '2',
+            'classifier-async-mode': '1',
+            'is-classifier': '1',
+            'operate-on-gie-id': str(secondary.PGIE_UNIQUE_ID),
+            'operate-on-class-ids': stage.properties['operate-on-class-ids'],
+            'input-object-min-width': stage.properties['input-object-min-width'],
+            'gie-unique-id': str(stage.gie_id),
+            'model-file': stage.properties['model-file'],
+        }
+        for key, value in expected.items():
+            check(p.get(key) == value, 'write_config: "%s" has %s=%s, should be %s' % (stage.name, key, p.get(key), value))
+
+
+def check_ids(directory):
+    path = os.path.join(directory, 'ids.cfg')
+    with open(path, 'w') as f:
+        f.write('[a]\ngie-unique-id=5\n[b]\ngie-unique-id=5\n[c]\n[pgie]\ngie-unique-id=%d\n[d]\ngie-unique-id=3\n' % secondary.PGIE_UNIQUE_ID)
+    for names, bad in [('a,b', True), ('pgie', True), ('a,c', False), ('a,c,d', False), ('missing', True)]:
+        try:
+            stages = secondary.load_stages(path, names)
+            check(not bad, 'load_stages: "%s" should be rejected' % names)
+            ids = [s.gie_id for s in stages]
+            check(len(set(ids)) == len(ids) and secondary.PGIE_UNIQUE_ID not in ids, 'load_stages: "%s" gave gie-unique-ids %s' % (names, ids))
+        except ValueError:
+            check(bad, 'load_stages: "%s" should be accepted' % names)
+    # Stages without their own gie-unique-id get the next free one
+    stages = secondary.load_stages(path, 'd,c')
+    check([s.gie_id for s in stages] == [3, 2], 'load_stages: "d,c" gave gie-unique-ids %s, should be [3, 2]' % [s.gie_id for s in stages])
+    try:
+        secondary.load_stages(os.path.join(directory, 'missing.cfg'), 'a')
+        check(False, 'load_stages: a missing config file should be rejected')
+    except ValueError:
+        pass
+
+
+# Return what the probe should add to the text for a frame, worked out from
+# the stand-ins' gating and labels (independently of the metadata)
+def expected_text(frame_objects, classifiers):
+    counts = {}
+    for class_id, confidence, left, top, width, height in frame_objects:
+        for c in classifiers:
+            if c.stage.accepts(class_id, width, height):
+                key = (c.stage.gie_id, c.labels[int(left + top) % len(c.labels)])
+                counts[key] = counts.get(key, 0) + 1
+    text = ''
+    last_gie_id = None
+    for gie_id, label in sorted(counts):
+        if gie_id != last_gie_id:
+            text += '  {}:'.format(probe.secondary_names[gie_id])
+            last_gie_id = gie_id
+        text += ' {}={}'.format(label, counts[(gie_id, label)])
+    return text, sum(counts.values())
+
+
+def check_counting():
+    stages = [
+        secondary.Stage('kind', 2, { 'operate-on-class-ids': '0', 'input-object-min-width': '64', 'input-object-min-height': '64' }),
+        secondary.Stage('shade', 3, { 'operate-on-class-ids': '0;2', 'input-object-min-width': '128', 'input-object-min-height': '128' }),
+    ]
+    classifiers = [fakepyds.StandInClassifier(stage, ['red', 'green', 'blue']) for stage in stages]
+    for stage in stages:
+        probe.secondary_names[stage.gie_id] = stage.name
+    seen = []
+    def hook(frame_meta, detections, obj_counter):
+        seen.append(sum(len(d.labels) for d in detections))
+    probe.frame_hooks[:] = [hook]
+
+    total_objects = 0
+    total_classified = 0
+    for frame_num in range(FRAMES):
+        objects = []
+        for i in range(random.randint(0, 20)):
+            objects.append((random.randint(0, 3), 0.5, random.uniform(0, 1800), random.uniform(0, 1000), random.uniform(10, 300), random.uniform(10, 300)))
+        batch = fakepyds.make_batch([(0, frame_num, objects)])
+        for c in classifiers:
+            c.classify_batch(batch)
+        del seen[:]
+        probe.process_batch(batch)
+        frame_meta = batch.frames[0]
+        text = fakepyds.get_string(frame_meta.display_meta[0].text_params[0].display_text)
+        expected, classified = expected_text(objects, classifiers)
+        primary = text.split('  ')[:6]
+        check('  '.join(primary) + expected == text, 'frame %d: the probe drew "%s", expected "...%s"' % (frame_num, text, expected))
+        check(seen == [classified], 'frame %d: the probe passed on %s labels, expected %d' % (frame_num, seen, classified))
+        fakepyds.release_batch(batch)
+        total_objects += len(objects)
+        total_classified += classified
+    check(sum(c.classified for c in classifiers) == total_classified, 'the stand-ins classified %d objects, expected %d' % (sum(c.classified for c in classifiers), total_classified))
+    check(all(c.classified + c.skipped == total_objects for c in classifiers), 'the stand-ins did not look at every object once')
+    check(fakepyds.outstanding() == 0, 'the probe left %d stand-in "C" allocations' % fakepyds.outstanding())
+
+
+def main(args):
+    random.seed(1)
+    probe.show_frames = False
+    directory = tempfile.mkdtemp()
+    check_gating()
+    check_configs(directory)
+    check_ids(directory)
+    check_counting()
+
+    return checks.report('Secondary inference checks')
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
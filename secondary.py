@@ -0,0 +1,124 @@
+#
+# Secondary inference stages (MegaMosquito)
+#
+# The primary detector (PGIE) finds the objects. Secondary classifiers
+# (SGIEs) then look at some of those objects more closely (e.g., the type,
+# or the color, of vehicles). Each secondary stage is another nvinfer
+# element, chained after the PGIE, in "secondary" mode. To keep the GPU
+# load down, each one is "gated": it only looks at objects of the primary
+# classes it is configured for, and only those big enough to be worth it.
+# In asynchronous mode, it also only looks at each (tracked) object now and
+# then, rather than in every frame, and its results are attached to the
+# object's metadata in later frames.
+#
+# The stages are described in SECONDARY_CONFIG_FILE (by default, see
+# "secondary-inference.cfg"). This module reads that file, and generates an
+# nvinfer config file for each enabled stage. A stand-in classifier that
+# applies the same gating without a GPU is in "fakepyds.py" (see
+# "StandInClassifier" there), and "secondary-test.py" checks all of this.
+#
+
+import os
+import configparser
+
+
+# Everything in a stage's nvinfer config file that the stage's own section
+# does not set. These make it an asynchronous secondary classifier that
+# operates on the objects found by the PGIE (see "deepstream-rtsp.cfg").
+SECONDARY_DEFAULTS = [
+    ('gpu-id', '0'),
+    ('net-scale-factor', '1'),
+    ('force-implicit-batch-dim', '1'),
+    ('batch-size', '16'),
+    ('network-mode', '1'),
+    ('model-color-format', '1'),
+    ('process-mode', '2'),
+    ('is-classifier', '1'),
+    ('classifier-async-mode', '1'),
+    ('classifier-threshold', '0.51'),
+    ('operate-on-gie-id', '1'),
+]
+
+# The PGIE's gie-unique-id (see "deepstream-rtsp.cfg"). Stages without a
+# gie-unique-id of their own are numbered from the one after this.
+PGIE_UNIQUE_ID = 1
+
+
+class Stage:
+
+    def __init__(self, name, gie_id, properties):
+        self.name = name
+        self.gie_id = gie_id
+        self.properties = properties
+        # The gating: which primary classes, and how big (0 means any)
+        classes = properties.get('operate-on-class-ids', '')
+        self.class_ids = set([int(c) for c in classes.split(';') if '' != c.strip()])
+        self.min_width = int(properties.get('input-object-min-width', '0'))
+        self.min_height = int(properties.get('input-object-min-height', '0'))
+
+    # Does this stage classify an object of this class and size? This is the
+    # same test nvinfer applies, in secondary mode, with this config.
+    def accepts(self, class_id, width, height):
+        if self.class_ids and class_id not in self.class_ids:
+            return False
+        return width >= self.min_width and height >= self.min_height
+
+    # Return the labels this stage's model can produce (from its label file),
+    # or None if the label file can't be read.
+    def labels(self):
+        path = self.properties.get('labelfile-path', '')
+        if '' == path or not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            text = f.read()
+        # Classifier label files have the labels on one line, with ";"
+        # between them (detector label files have one label per line)
+        return [l.strip() for l in text.replace('\n', ';').split(';') if '' != l.strip()]
+
+    # Write the nvinfer config file for this stage into "directory", and
+    # return its path
+    def write_config(self, directory):
+        config = configparser.ConfigParser()
+        config.optionxform = str # nvinfer property names are case sensitive
+        config['property'] = {}
+        for key, value in SECONDARY_DEFAULTS:
+            config['property'][key] = value
+        for key, value in self.properties.items():
+            config['property'][key] = value
+        config['property']['gie-unique-id'] = str(self.gie_id)
+        path = os.path.join(directory, 'secondary-%s.cfg' % self.name)
+        with open(path, 'w') as f:
+            f.write('# Generated by secondary.py from the "%s" stage\n' % self.name)
+            config.write(f, space_around_delimiters=False)
+        return path
+
+
+#
+# Read the stages in "names" (a comma-separated list of section names) from
+# the config file at "path", in that order. Raises ValueError if the file
+# or any of the sections is missing.
+#
+def load_stages(path, names):
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    if not config.read(path):
+        raise ValueError('secondary inference config file "%s" was not found' % path)
+    stages = []
+    used_ids = set([PGIE_UNIQUE_ID])
+    next_id = PGIE_UNIQUE_ID + 1
+    for name in [n.strip() for n in names.split(',') if '' != n.strip()]:
+        if not config.has_section(name):
+            raise ValueError('secondary inference stage "%s" is not in "%s"' % (name, path))
+        properties = dict(config.items(name))
+        if 'gie-unique-id' in properties:
+            gie_id = int(properties.pop('gie-unique-id'))
+        else:
+            while next_id in used_ids:
+                next_id += 1
+            gie_id = next_id
+        if gie_id in used_ids:
+            raise ValueError('secondary inference stage "%s" has a gie-unique-id (%d) already in use' % (name, gie_id))
+        used_ids.add(gie_id)
+        stages.append(Stage(name, gie_id, properties))
+    return stages
+
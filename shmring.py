@@ -0,0 +1,229 @@
+#
+# Shared memory detection ring buffer (MegaMosquito)
+#
+# The probe (see "probe.py") sees every detection, for every frame. Other
+# processes on the same host (e.g., alerting, dashboards, a recorder) that
+# want those detections can read them from here, instead of each of them
+# pulling the RTSP stream or parsing the log output.
+#
+# The detections are written into a memory-mapped file (by default in
+# /dev/shm, so it is really just shared memory) as fixed size records in a
+# ring buffer. There is one writer (the probe) and any number of readers.
+# The writer never waits for the readers. Each reader keeps its own place
+# in the ring and reads at its own pace, straight out of the shared memory
+# (no sockets, no pipes, no copies other than unpacking the values). A
+# reader that falls so far behind that the writer has gone all the way
+# around the ring and overwritten records it has not read yet just finds
+# out (see "dropped" below) and carries on from the oldest record still
+# there. A slow reader never slows down the pipeline. If the pipeline is
+# restarted, the new writer replaces the file with a new ring, and readers
+# notice that, re-open it, and carry on (see "restarts" below).
+#
+# The file layout is:
+#
+#   +--------+----------+----------+----------+-----+--------------+
+#   | header | record 0 | record 1 | record 2 | ... | record N - 1 |
+#   +--------+----------+----------+----------+-----+--------------+
+#
+# The header (HEADER_SIZE bytes):
+#     8 bytes: magic "SLIPRING"
+#     u32:     format version
+#     u32:     record size, in bytes
+#     u32:     capacity (N), in records
+#     u32:     (unused)
+#     u64:     sequence number of the next record to be written
+#
+# Each record (RECORD_SIZE bytes) is one detection:
+#     u64:     sequence number of this record (its slot is seq % N)
+#     f64:     time it was published (seconds since the epoch)
+#     u32:     source id
+#     u32:     frame number
+#     i32:     class id
+#     f32:     confidence
+#     f32 x 4: left, top, width, height (pixels, streammux coordinates)
+#
+# All values are in native byte order (readers are on the same host).
+#
+# The writer updates a record by first setting its sequence number to BUSY,
+# then writing the rest of the record, then writing the real sequence
+# number. When all records for a frame are written, it updates the header
+# to publish them. A reader checks the record's sequence number before and
+# after unpacking it, so it can tell if the record was overwritten while
+# it was being read.
+#
+
+import os
+import mmap
+import time
+import struct
+import collections
+
+
+MAGIC = b'SLIPRING'
+VERSION = 1
+
+_HEADER = struct.Struct('=8sIIIIQ')
+_HEADER_SEQ = struct.Struct('=Q')
+_HEADER_SEQ_OFFSET = 24
+HEADER_SIZE = 64
+
+_RECORD = struct.Struct('=QdIIif4f')
+_RECORD_SEQ = struct.Struct('=Q')
+RECORD_SIZE = _RECORD.size
+
+BUSY = 0xffffffffffffffff
+
+# The default location for the ring
+DEFAULT_PATH = '/dev/shm/slipstream-detections'
+
+
+# A record, as returned to readers
+Record = collections.namedtuple('Record', ['seq', 'timestamp', 'source_id', 'frame_num', 'class_id', 'confidence', 'left', 'top', 'width', 'height'])
+
+
+class RingWriter:
+
+    # Create (or re-create) the ring at "path" with room for "capacity"
+    # records. Readers that had the old ring open notice the new one, and
+    # re-open it (see "RingReader.read").
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        size = HEADER_SIZE + capacity * RECORD_SIZE
+        tmp = '%s.%d' % (path, os.getpid())
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        _HEADER.pack_into(self.map, 0, MAGIC, VERSION, RECORD_SIZE, capacity, 0, 0)
+        # Replace any old ring in one step, so readers never see half of one
+        os.rename(tmp, path)
+        self.seq = 0
+
+    # Write the detections for one frame into the ring, then publish them
+    def publish(self, source_id, frame_num, detections, timestamp=None):
+        if not detections:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        for d in detections:
+            offset = HEADER_SIZE + (self.seq % self.capacity) * RECORD_SIZE
+            _RECORD_SEQ.pack_into(self.map, offset, BUSY)
+            _RECORD.pack_into(self.map, offset, BUSY, timestamp, source_id, frame_num, d.class_id, d.confidence, d.left, d.top, d.width, d.height)
+            _RECORD_SEQ.pack_into(self.map, offset, self.seq)
+            self.seq += 1
+        _HEADER_SEQ.pack_into(self.map, _HEADER_SEQ_OFFSET, self.seq)
+
+    # A probe frame hook (see "probe.py")
+    def frame(self, frame_meta, detections, obj_counter):
+        self.publish(frame_meta.source_id, frame_meta.frame_num, detections)
+
+    def close(self):
+        self.map.close()
+
+
+class RingReader:
+
+    # Open the ring at "path". A new reader starts with the next record
+    # written, or (if "oldest" is True) with the oldest record still there.
+    def __init__(self, path=DEFAULT_PATH, oldest=False):
+        self.path = path
+        seq = self._open()
+        self.next = max(0, seq - self.capacity) if oldest else seq
+        # The number of records this reader has missed by falling behind
+        self.dropped = 0
+        # The number of times the writer has re-created the ring (e.g., the
+        # pipeline was restarted) while this reader had it open
+        self.restarts = 0
+
+    # Map the ring file, and return the sequence number of its next record
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(f.fileno())
+        magic, version, record_size, capacity, unused, seq = _HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            self.map.close()
+            raise ValueError('%s is not a detection ring (or is a different version)' % self.path)
+        self.capacity = capacity
+        self.inode = (stat.st_dev, stat.st_ino)
+        return seq
+
+    #
+    # A restarted writer replaces the ring file with a new one (see
+    # "RingWriter"), and the old one (still mapped here) never changes again.
+    # So when there is nothing new to read, check whether the file at "path"
+    # is still the one mapped. If not, re-open it, and carry on from the
+    # oldest record in the new ring. Returns True if it was re-opened.
+    #
+    def _reopen_if_replaced(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # Gone (for now), so there is nothing new to re-open
+            return False
+        if (stat.st_dev, stat.st_ino) == self.inode:
+            return False
+        old = self.map
+        try:
+            seq = self._open()
+        except (OSError, ValueError):
+            # Not ready yet (e.g., replaced again in the meantime)
+            self.map = old
+            return False
+        old.close()
+        self.next = max(0, seq - self.capacity)
+        self.restarts += 1
+        return True
+
+    # Return the sequence number of the next record to be written
+    def head(self):
+        return _HEADER_SEQ.unpack_from(self.map, _HEADER_SEQ_OFFSET)[0]
+
+    # Return the number of records waiting to be read
+    def behind(self):
+        if self.head() == self.next:
+            self._reopen_if_replaced()
+        return self.head() - self.next
+
+    # Return a list of the records published since the last read (at most
+    # "limit" of them, if given). If this reader has fallen behind, the
+    # records it missed are skipped and counted in "dropped". If the ring
+    # has been re-created, it is re-opened (see "restarts").
+    def read(self, limit=None):
+        head = self.head()
+        if head == self.next and self._reopen_if_replaced():
+            head = self.head()
+        if head - self.next > self.capacity:
+            self.dropped += head - self.capacity - self.next
+            self.next = head - self.capacity
+        end = head if limit is None else min(head, self.next + limit)
+        records = []
+        while self.next < end:
+            offset = HEADER_SIZE + (self.next % self.capacity) * RECORD_SIZE
+            record = _RECORD.unpack_from(self.map, offset)
+            if record[0] != self.next or _RECORD_SEQ.unpack_from(self.map, offset)[0] != self.next:
+                # The writer has lapped us while we were reading, so skip
+                # ahead to the oldest record that is still there (or just
+                # past this one, if the writer is part way through a frame)
+                skip_to = max(self.next + 1, self.head() - self.capacity)
+                self.dropped += skip_to - self.next
+                self.next = skip_to
+                continue
+            records.append(Record._make(record))
+            self.next += 1
+        return records
+
+    # Read records forever, waiting "poll" seconds when there are none
+    def follow(self, poll=0.01):
+        while True:
+            records = self.read()
+            if not records:
+                time.sleep(poll)
+            for record in records:
+                yield record
+
+    def close(self):
+        self.map.close()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+#
+# Soak test with a stand-in for pyds (MegaMosquito)
+#
+# This runs the Python side of the pipeline (the probe in "probe.py", and
+# everything hooked into it) for a long time, with no GPU, no Deepstream
+# and no Gstreamer. Batches of synthetic detections are made with the pyds
+# stand-in in "fakepyds.py" and fed to the probe at SOAK_FPS frames per
+# second from each of SOAK_SOURCES sources. Memory, Python objects, stand-in
+# "C" allocations and frame rates are sampled, and checked against limits,
+# by the monitor in "soak.py". The exit status is 0 if the test passed.
+#
+# Any exports configured in the environment (see "exports.py") are run too,
+# as are stand-ins for any secondary inference stages in SECONDARY_INFERENCE
+# (see "secondary.py").
+#
+# This catches leaks in our Python code, so it is suitable for CI on CPU
+# only machines, e.g., a 10 minute run, sampling every 10 seconds:
+#
+#    SOAK_SECONDS=600 SOAK_INTERVAL=10 SOAK_WARMUP=60 python3 soak-test.py
+#
+# To soak test the real pipeline (on NVIDIA hardware) instead, set
+# SOAK_SECONDS when running deepstream-rtsp.py (with "synthetic://" inputs
+# if you don't want to depend on your cameras).
+#
+
+# Basic dependencies
+import os
+import sys
+import time
+import random
+
+
+# Configuration from the process environment (see "environment.py")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from environment import get_from_env
+SOAK_SECONDS = int(get_from_env('SOAK_SECONDS', '3600')) # Soak test length
+SOAK_INTERVAL = int(get_from_env('SOAK_INTERVAL', '60')) # Seconds between samples
+SOAK_SOURCES = int(get_from_env('SOAK_SOURCES', '4')) # Number of synthetic sources
+SOAK_FPS = float(get_from_env('SOAK_FPS', '30')) # Frames per second, per source
+SOAK_MAX_OBJECTS = int(get_from_env('SOAK_MAX_OBJECTS', '20')) # Per frame
+SHOW_FRAMES = 'no' != get_from_env('SHOW_FRAMES', 'no') # Default is not to show
+SECONDARY_INFERENCE = get_from_env('SECONDARY_INFERENCE', '') # Stage names (default none)
+SECONDARY_CONFIG_FILE = get_from_env('SECONDARY_CONFIG_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'secondary-inference.cfg'))
+
+# Use the stand-in for the Deepstream Python bindings
+import fakepyds
+sys.modules['pyds'] = fakepyds
+import probe
+import soak
+import exports
+import secondary
+
+
+# Make a batch with one frame from each source, with random detections
+def synthetic_batch(frame_num):
+    frames = []
+    for source_id in range(SOAK_SOURCES):
+        objects = []
+        for i in range(random.randint(0, SOAK_MAX_OBJECTS)):
+            left = random.uniform(0, 1800)
+            top = random.uniform(0, 1000)
+            objects.append((random.randint(0, 3), random.random(), left, top, random.uniform(10, 1920 - left), random.uniform(10, 1080 - top)))
+        frames.append((source_id, frame_num, objects))
+    return fakepyds.make_batch(frames)
+
+
+def main(args):
+    probe.show_frames = SHOW_FRAMES
+    monitor = soak.monitor_from_settings(
+        gauges={ 'pyds_allocations': fakepyds.outstanding },
+        extra_limits={ 'pyds_allocations': float(get_from_env('SOAK_MAX_PYDS_GROWTH', '0')) })
+    probe.frame_hooks.append(monitor.frame)
+    # Run the same exports the pipeline would (see "exports.py")
+    exports.start(SOAK_SOURCES)
+    # And stand-ins for any secondary inference stages (see "secondary.py")
+    classifiers = []
+    if SECONDARY_INFERENCE:
+        for stage in secondary.load_stages(SECONDARY_CONFIG_FILE, SECONDARY_INFERENCE):
+            classifiers.append(fakepyds.StandInClassifier(stage))
+            probe.secondary_names[stage.gie_id] = stage.name
+    print('Soak test (pyds stand-in): %d sources at %.1f FPS, for %ds, sampling every %ds' % (SOAK_SOURCES, SOAK_FPS, SOAK_SECONDS, SOAK_INTERVAL))
+
+    frame_num = 0
+    next_frame = time.time()
+    next_sample = monitor.start + SOAK_INTERVAL
+    end = monitor.start + SOAK_SECONDS
+    while True:
+        # Keep to the frame rate (like the live sources in the real pipeline)
+        now = time.time()
+        if next_frame > now:
+            time.sleep(next_frame - now)
+        next_frame = max(next_frame, now) + 1.0 / SOAK_FPS
+
+        batch = synthetic_batch(frame_num)
+        for classifier in classifiers:
+            classifier.classify_batch(batch)
+        probe.process_batch(batch)
+        fakepyds.release_batch(batch)
+        frame_num += 1
+
+        now = time.time()
+        if now >= next_sample:
+            next_sample += SOAK_INTERVAL
+            if not monitor.sample() or now >= end:
+                break
+
+    for classifier in classifiers:
+        print('Secondary inference stand-in "%s": %d objects classified, %d skipped by gating' % (classifier.stage.name, classifier.classified, classifier.skipped))
+    return monitor.report()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,141 @@
+#
+# Soak test monitoring (MegaMosquito)
+#
+# A soak test runs the pipeline for a long time (hours) and watches for the
+# slow problems that short runs never show: memory that grows a little with
+# every frame, and frame rates that sag over time. The "SoakMonitor" below
+# is given a sample every so often (every SOAK_INTERVAL seconds). Each
+# sample records:
+#   - the process resident set size (RSS), in MB
+#   - the number of objects the Python garbage collector is tracking
+#   - the number of memory blocks allocated by Python (this catches leaks of
+#     things the garbage collector does not track, like strings, numbers,
+#     and dicts that hold only those)
+#   - anything else the caller asks for (e.g., see "outstanding" in
+#     fakepyds.py)
+#   - the frame rate of each source over the interval since the last sample
+#
+# The first samples (for SOAK_WARMUP seconds) are ignored, since things
+# like caches and pools are still filling up then. The first sample after
+# that is the baseline. After that, the test fails as soon as any of these
+# grows by more than its limit over its baseline value, or the frame rate
+# of any source drifts from its baseline by more than SOAK_MAX_FPS_DRIFT
+# (a fraction, e.g., 0.1 is 10%).
+#
+# The monitor counts frames through the probe's frame hooks (see "probe.py")
+# so add "monitor.frame" to "probe.frame_hooks" to use it.
+#
+
+import gc
+import os
+import sys
+import time
+
+from environment import get_from_env
+
+
+# Return the resident set size of this process, in MB
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+
+# Return the number of objects tracked by the Python garbage collector
+def python_objects():
+    return len(gc.get_objects())
+
+# Return the number of memory blocks currently allocated by Python
+def python_blocks():
+    return sys.getallocatedblocks()
+
+
+class SoakMonitor:
+
+    # "limits" gives the allowed growth for each gauge (by name), and
+    # "gauges" gives any extra gauges to sample (name -> function).
+    def __init__(self, warmup, max_fps_drift, limits, gauges=None):
+        self.warmup = warmup
+        self.max_fps_drift = max_fps_drift
+        self.limits = limits
+        self.gauges = { 'rss_mb': rss_mb, 'python_objects': python_objects, 'python_blocks': python_blocks }
+        if gauges:
+            self.gauges.update(gauges)
+        self.start = time.time()
+        self.last = self.start
+        self.frames = {}
+        self.baseline = None
+        self.baseline_fps = None
+        self.samples = []
+        self.failures = []
+
+    # A probe frame hook (see "probe.py"), to count frames per source
+    def frame(self, frame_meta, detections, obj_counter):
+        source_id = frame_meta.source_id
+        self.frames[source_id] = self.frames.get(source_id, 0) + 1
+
+    # Take a sample. Returns False once the test has failed.
+    def sample(self):
+        now = time.time()
+        elapsed = now - self.last
+        self.last = now
+        fps = {}
+        for source_id, count in self.frames.items():
+            fps[source_id] = count / elapsed if elapsed > 0 else 0.0
+            self.frames[source_id] = 0
+        values = {}
+        for name, gauge in self.gauges.items():
+            values[name] = gauge()
+        self.samples.append((now - self.start, values, fps))
+
+        # Ignore everything until the warmup is over, then take a baseline
+        if now - self.start < self.warmup:
+            return True
+        if self.baseline is None:
+            self.baseline = values
+            self.baseline_fps = fps
+            return True
+
+        # Compare this sample with the baseline
+        for name, limit in self.limits.items():
+            growth = values[name] - self.baseline[name]
+            if growth > limit:
+                self.failures.append('%s grew by %.1f (limit %.1f) after %ds' % (name, growth, limit, now - self.start))
+        for source_id, base in self.baseline_fps.items():
+            current = fps.get(source_id, 0.0)
+            if base > 0 and abs(current - base) / base > self.max_fps_drift:
+                self.failures.append('source %d FPS drifted from %.1f to %.1f (limit %d%%) after %ds' % (source_id, base, current, 100 * self.max_fps_drift, now - self.start))
+        return not self.failures
+
+    def failed(self):
+        return len(self.failures) > 0
+
+    # Print the samples, and the result. Returns 0 if passed, 1 if failed.
+    def report(self):
+        print('\n*** Soak test samples:')
+        for t, values, fps in self.samples:
+            gauges = '  '.join(['%s=%.1f' % (name, values[name]) for name in sorted(values)])
+            rates = '  '.join(['fps[%d]=%.1f' % (s, fps[s]) for s in sorted(fps)])
+            print('  t=%6ds  %s  %s' % (t, gauges, rates))
+        if self.failed():
+            print('*** Soak test FAILED:')
+            for failure in self.failures:
+                print('  ' + failure)
+            return 1
+        print('*** Soak test passed.')
+        return 0
+
+
+# Make a monitor from the SOAK_* settings (see deepstream-rtsp.py)
+def monitor_from_settings(gauges=None, extra_limits=None):
+    limits = {
+        'rss_mb': float(get_from_env('SOAK_MAX_RSS_GROWTH_MB', '50')),
+        'python_objects': float(get_from_env('SOAK_MAX_OBJECT_GROWTH', '10000')),
+        'python_blocks': float(get_from_env('SOAK_MAX_BLOCK_GROWTH', '100000')),
+    }
+    if extra_limits:
+        limits.update(extra_limits)
+    return SoakMonitor(
+        float(get_from_env('SOAK_WARMUP', '300')),
+        float(get_from_env('SOAK_MAX_FPS_DRIFT', '0.1')),
+        limits,
+        gauges)
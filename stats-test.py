@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+#
+# Rolling statistics checks (MegaMosquito)
+#
+# This checks the statistics store (see "stats.py"), and its HTTP endpoint
+# on a local port, with synthetic frame counts at fixed times (see
+# "checks.py"):
+#
+#    python3 stats-test.py
+#
+# It checks:
+#   - that the counts come back in the right buckets, at every resolution,
+#     and that each coarse bucket is the sum of the fine buckets in it
+#   - that when time moves on past the number of buckets a resolution
+#     keeps, the re-used buckets start from 0 again, and that buckets not
+#     re-used yet (but too old) count as 0, without losing the coarser
+#     resolutions that still keep that time
+#   - that the memory used does not grow
+#   - that ranges are limited to the buckets kept, and that ranges that are
+#     empty, in the future, or too old, have no buckets
+#   - that the endpoint answers bad "source", "class", "last" (and other)
+#     parameters with 400, and unknown pages with 404
+#
+# The exit status is 0 if all checks pass.
+#
+
+# Basic dependencies
+import os
+import sys
+import json
+import random
+import urllib.error
+import urllib.request
+
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import stats
+from checks import check
+import checks
+
+CLASSES = ['vehicle', 'bicycle', 'person', 'roadsign']
+
+SOURCES = 3
+
+# A time at the start of an hour (so it starts a bucket at every resolution)
+T0 = 3600.0 * 500000
+
+# The number of buckets each resolution keeps, and how wide they are
+SLOTS = dict([(name, slots) for name, width, slots in stats.RESOLUTIONS])
+WIDTH = dict([(name, width) for name, width, slots in stats.RESOLUTIONS])
+
+
+# Add random frames, at random times from "start" for "seconds", to the
+# store, and to "expected", the totals by (source id, class name or
+# "frames", time in whole seconds)
+def add_frames(store, expected, start, seconds, count):
+    for i in range(count):
+        now = start + random.uniform(0, seconds)
+        source_id = random.randrange(SOURCES)
+        obj_counter = dict([(c, random.randint(0, 3)) for c in range(len(CLASSES))])
+        store.add(source_id, obj_counter, now)
+        second = int(now)
+        for key, n in [('frames', 1)] + [(CLASSES[c], n) for c, n in obj_counter.items()]:
+            expected[(source_id, key, second)] = expected.get((source_id, key, second), 0) + n
+
+
+# The expected total for (source, key) over the bucket starting at "t"
+def total(expected, source_id, key, t, width):
+    return sum([expected.get((source_id, key, s), 0) for s in range(int(t), int(t + width))])
+
+
+def check_buckets():
+    store = stats.StatsStore(SOURCES, CLASSES)
+    expected = {}
+    # 20 minutes of frames, from 10 minutes into the hour
+    add_frames(store, expected, T0 + 600, 1200, 5000)
+    now = T0 + 1800
+    for resolution in ['second', 'minute', 'hour']:
+        width = WIDTH[resolution]
+        result = store.query(resolution, T0, now, now=now)
+        times = result['times']
+        check(times == [T0 + i * width for i in range(len(times))], '%s: the times %s... are not every %ds from the start' % (resolution, times[:3], width))
+        check(times and times[-1] <= now < times[-1] + width, '%s: the last bucket (%s) is not the one for now' % (resolution, times[-1:]))
+        for source_id in range(SOURCES):
+            values = result['sources'][str(source_id)]
+            for key in ['frames'] + CLASSES:
+                wrong = [t for t, v in zip(times, values[key]) if v != total(expected, source_id, key, t, width)]
+                check(not wrong, '%s: source %d "%s" is wrong in the buckets at %s' % (resolution, source_id, key, wrong[:3]))
+    # Each minute is the sum of its seconds, and the hour the sum of its
+    # minutes
+    seconds = store.query('second', T0, now, now=now)
+    minutes = store.query('minute', T0, now, now=now)
+    hours = store.query('hour', T0, now, now=now)
+    for source_id in range(SOURCES):
+        s = seconds['sources'][str(source_id)]
+        m = minutes['sources'][str(source_id)]
+        h = hours['sources'][str(source_id)]
+        for key in ['frames'] + CLASSES:
+            sums = [sum(s[key][i * 60:(i + 1) * 60]) for i in range(len(m[key]))]
+            check(sums == m[key], 'source %d "%s": the minutes are not the sums of their seconds' % (source_id, key))
+            check([sum(m[key])] == h[key], 'source %d "%s": the hour is not the sum of its minutes' % (source_id, key))
+    # Only the sources and classes asked for
+    result = store.query('minute', T0, now, [1], ['person'], now=now)
+    check(list(result['sources']) == ['1'] and sorted(result['sources']['1']) == ['frames', 'person'], 'the query for source 1, "person", returned %s' % dict([(k, sorted(v)) for k, v in result['sources'].items()]))
+
+
+def check_rollover():
+    store = stats.StatsStore(SOURCES, CLASSES)
+    sizes = [(len(r.bucket), len(r.frames), len(r.counts)) for r in store.rings.values()]
+    expected = {}
+    # The first 100 seconds, and then the same 100 seconds of the hour two
+    # hours later (so the "second" ring has gone round twice, re-using the
+    # same slots for them, while the "minute" ring still keeps both)
+    add_frames(store, expected, T0, 100, 2000)
+    # And some from 150 to 160 seconds in, whose slots in the "second" ring
+    # are not re-used later (but are too old by then)
+    add_frames(store, expected, T0 + 150, 10, 200)
+    later = T0 + 2 * SLOTS['second']
+    add_frames(store, expected, later, 100, 2000)
+    # And one frame, 50 seconds into the first 100, where the earlier
+    # counts were
+    store.add(0, { 0: 5 }, later + 50.5)
+    expected[(0, 'frames', int(later + 50.5))] = expected.get((0, 'frames', int(later + 50.5)), 0) + 1
+    expected[(0, 'vehicle', int(later + 50.5))] = expected.get((0, 'vehicle', int(later + 50.5)), 0) + 5
+    now = later + 200
+    # The "second" ring has only the later counts (the buckets at 150 to 160
+    # seconds into this hour are in range, but their slots still hold the
+    # counts from two hours ago, which must count as 0)
+    result = store.query('second', 0, now, now=now)
+    times = result['times']
+    check(len(times) == SLOTS['second'] and times[-1] == int(now), 'second: the range was not limited to the last %d buckets (%d buckets, the last at %s)' % (SLOTS['second'], len(times), times[-1:]))
+    for source_id in range(SOURCES):
+        values = result['sources'][str(source_id)]
+        for key in ['frames'] + CLASSES:
+            wrong = [t for t, v in zip(times, values[key]) if v != total(expected, source_id, key, t, 1)]
+            check(not wrong, 'second: after going round, source %d "%s" is wrong at %s' % (source_id, key, wrong[:3]))
+    # The earlier buckets are gone from it, even where the slot has not been
+    # re-used since (they are too old, and count as 0)
+    old = store.query('second', T0, T0 + 100, now=now)
+    check(old['times'] == [], 'second: buckets more than an hour old were returned: %s' % old['times'][:3])
+    ring = store.rings['second']
+    tags, frames, counts = ring.copy([0], [0])
+    stale = ring.values(frames[0], tags, range(int(T0), int(T0) + 100))
+    check(stale == [0] * 100, 'second: the slots of buckets since re-used, or too old, did not count as 0')
+    # The "minute" ring still has both
+    result = store.query('minute', T0, now, now=now)
+    for source_id in range(SOURCES):
+        values = result['sources'][str(source_id)]
+        for key in ['frames'] + CLASSES:
+            wrong = [t for t, v in zip(result['times'], values[key]) if v != total(expected, source_id, key, t, 60)]
+            check(not wrong, 'minute: after the "second" ring went round, source %d "%s" is wrong at %s' % (source_id, key, wrong[:3]))
+    # Going round again and again uses no more memory
+    for i in range(10):
+        store.add(i % SOURCES, { 2: 1 }, now + i * 3600 * 24 * 40)
+    check([(len(r.bucket), len(r.frames), len(r.counts)) for r in store.rings.values()] == sizes, 'the rings grew')
+    # Unknown sources are ignored
+    store.add(SOURCES, { 0: 1 }, now)
+    store.add(-1, { 0: 1 }, now)
+
+
+def check_ranges():
+    store = stats.StatsStore(SOURCES, CLASSES)
+    store.add(0, { 0: 1 }, T0 + 10)
+    now = T0 + 30
+    for what, start, end in [
+            ('a range that ends before it starts', now, now - 60),
+            ('a range in the future', now + 60, now + 120),
+            ('a range older than is kept', now - 7200, now - 3601),
+        ]:
+        result = store.query('second', start, end, now=now)
+        check(result['times'] == [] and result['sources']['0']['frames'] == [], 'second: %s has buckets %s' % (what, result['times'][:3]))
+    # A range into the future stops at now
+    result = store.query('second', now - 5, now + 60, now=now)
+    check(result['times'] == [now - 5 + i for i in range(6)], 'second: a range past now gave buckets %s' % result['times'])
+    for args in [('day', 0, now), ('second', 0, now, [SOURCES]), ('second', 0, now, [-1]), ('second', 0, now, None, ['dog'])]:
+        try:
+            store.query(*args, now=now)
+            check(False, 'query%s should be rejected' % (args,))
+        except ValueError:
+            pass
+
+
+def get(port, query):
+    try:
+        with urllib.request.urlopen('http://127.0.0.1:%d%s' % (port, query), timeout=10) as r:
+            return r.status, json.loads(r.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read().decode('utf-8'))
+
+
+def check_http():
+    store = stats.StatsStore(SOURCES, CLASSES)
+    store.add(1, { 2: 4 }, None)
+    stats.pages['/test'] = lambda: { 'ok': True }
+    server = stats.serve(store, 0)
+    port = server.server_address[1]
+    try:
+        status, body = get(port, '/stats?resolution=second&last=60&source=1&class=person')
+        check(status == 200 and sum(body.get('sources', {}).get('1', {}).get('person', [])) == 4, '/stats: the person count for source 1 is wrong (%d, %s)' % (status, body))
+        status, body = get(port, '/stats?source=0&source=2')
+        check(status == 200 and sorted(body.get('sources', {})) == ['0', '2'], '/stats: repeated "source" parameters gave %d, %s' % (status, body))
+        for query in ['source=x', 'source=%d' % SOURCES, 'source=-1', 'source=0&source=x', 'class=dog',
+                      'last=x', 'last=-60', 'last=inf', 'last=nan', 'start=x', 'end=-inf', 'resolution=day']:
+            status, body = get(port, '/stats?' + query)
+            check(status == 400 and 'error' in body, '/stats?%s should be a 400 error, not %d: %s' % (query, status, body))
+        check(get(port, '/nothing-here')[0] == 404, '/nothing-here should be 404')
+        check(get(port, '/test') == (200, { 'ok': True }), '/test (in "pages") was not served')
+    finally:
+        server.shutdown()
+        server.server_close()
+        del stats.pages['/test']
+
+
+def main(args):
+    random.seed(1)
+    check_buckets()
+    check_rollover()
+    check_ranges()
+    check_http()
+    return checks.report('Statistics checks')
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
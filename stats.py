@@ -0,0 +1,284 @@
+#
+# Rolling per-source, per-class statistics (MegaMosquito)
+#
+# The probe (see "probe.py") counts the objects of each class in every frame.
+# This keeps those counts for a while, so things like "persons per minute on
+# camera 3 over the last hour" can be answered, and serves them as JSON over
+# HTTP (see "serve" below).
+#
+# The counts are kept at several resolutions (see RESOLUTIONS), each in its
+# own ring of fixed-size time buckets, preallocated up front. For example,
+# the "second" resolution keeps the last hour in 3600 one-second buckets.
+# Every frame is added to the current bucket at every resolution at once,
+# so the coarser resolutions are always up to date (no separate pass is
+# needed to roll seconds up into minutes, and so on). When time moves into
+# a new bucket, the oldest bucket in that ring is cleared and re-used. So,
+# adding a frame takes the same (small) time no matter how long the
+# pipeline has been up, and the memory used never grows.
+#
+# For each bucket, for each source, it keeps:
+#   - the number of frames seen
+#   - for each class, the sum over those frames of the objects counted
+# So "count / frames" is the average number of objects of that class in
+# view, and "count" is the number of object sightings.
+#
+
+import json
+import math
+import time
+import array
+import threading
+import socketserver
+import urllib.parse
+import http.server
+
+
+# (name, bucket width in seconds, number of buckets kept)
+RESOLUTIONS = [
+    ('second', 1, 3600),     # The last hour
+    ('minute', 60, 1440),    # The last day
+    ('hour', 3600, 720),     # The last 30 days
+]
+
+
+class _Ring:
+
+    def __init__(self, width, slots, num_sources, num_classes):
+        self.width = width
+        self.slots = slots
+        self.num_classes = num_classes
+        # The bucket number (time // width) held in each slot, or -1
+        self.bucket = array.array('q', [-1]) * slots
+        # frames[source * slots + slot]
+        self.frames = array.array('L', [0]) * (num_sources * slots)
+        # counts[(source * num_classes + class) * slots + slot]
+        self.counts = array.array('L', [0]) * (num_sources * num_classes * slots)
+
+    def add(self, source_id, obj_counter, now):
+        b = int(now // self.width)
+        slot = b % self.slots
+        if self.bucket[slot] != b:
+            # Re-use the oldest slot for this new bucket
+            self.bucket[slot] = b
+            for i in range(slot, len(self.frames), self.slots):
+                self.frames[i] = 0
+            for i in range(slot, len(self.counts), self.slots):
+                self.counts[i] = 0
+        self.frames[source_id * self.slots + slot] += 1
+        base = source_id * self.num_classes
+        for class_id, n in obj_counter.items():
+            if n:
+                self.counts[(base + class_id) * self.slots + slot] += n
+
+    # Return the bucket numbers from "start" to "end" (times in seconds),
+    # limited to the ones still kept, and no later than "now"
+    def buckets(self, start, end, now):
+        last = int(now // self.width)
+        first = max(int(start // self.width), last - self.slots + 1)
+        last = min(last, int(end // self.width))
+        return range(first, last + 1)
+
+    # Return copies of the bucket numbers, and of the slots of the frames
+    # (by source id) and the counts (by (source id, class id)) asked for.
+    # Slicing an array is one C-level copy, so this is quick enough to do
+    # while holding the lock the probe needs for "add".
+    def copy(self, sources, class_ids):
+        s = self.slots
+        frames = {}
+        counts = {}
+        for source_id in sources:
+            frames[source_id] = self.frames[source_id * s:(source_id + 1) * s]
+            for class_id in class_ids:
+                i = (source_id * self.num_classes + class_id) * s
+                counts[(source_id, class_id)] = self.counts[i:i + s]
+        return self.bucket[:], frames, counts
+
+    # Return the values for buckets "buckets" from "slots" (a copy of one
+    # source's frames, or counts, from "copy"), where "tags" is the copy of
+    # the bucket numbers. Slots re-used since then count as 0.
+    def values(self, slots, tags, buckets):
+        values = []
+        for b in buckets:
+            slot = b % self.slots
+            values.append(slots[slot] if tags[slot] == b else 0)
+        return values
+
+
+class StatsStore:
+
+    # "class_names" maps class ids (0 to N-1) to their names
+    def __init__(self, num_sources, class_names):
+        self.num_sources = num_sources
+        self.class_names = class_names
+        self.lock = threading.Lock()
+        self.rings = {}
+        for name, width, slots in RESOLUTIONS:
+            self.rings[name] = _Ring(width, slots, num_sources, len(class_names))
+
+    # Add the counts for one frame
+    def add(self, source_id, obj_counter, now=None):
+        if source_id < 0 or source_id >= self.num_sources:
+            return
+        if now is None:
+            now = time.time()
+        with self.lock:
+            for ring in self.rings.values():
+                ring.add(source_id, obj_counter, now)
+
+    # A probe frame hook (see "probe.py")
+    def frame(self, frame_meta, detections, obj_counter):
+        self.add(frame_meta.source_id, obj_counter)
+
+    #
+    # Return the statistics for a time range, as a dict (ready for JSON):
+    #   {
+    #     "resolution": "minute", "seconds": 60,
+    #     "times": [ bucket start times ... ],
+    #     "sources": {
+    #       "3": { "frames": [ ... ], "person": [ ... ], ... },
+    #       ...
+    #     }
+    #   }
+    # Each list has one value per bucket (in "times"). "sources" and
+    # "classes" are lists of source ids and class names to include (all of
+    # them, if None). Raises ValueError for unknown names or ids.
+    #
+    def query(self, resolution, start, end, sources=None, classes=None, now=None):
+        if resolution not in self.rings:
+            raise ValueError('unknown resolution "%s" (use one of: %s)' % (resolution, ', '.join([r[0] for r in RESOLUTIONS])))
+        if sources is None:
+            sources = range(self.num_sources)
+        for source_id in sources:
+            if source_id < 0 or source_id >= self.num_sources:
+                raise ValueError('unknown source %d' % source_id)
+        if classes is None:
+            classes = self.class_names
+        class_ids = []
+        for name in classes:
+            if name not in self.class_names:
+                raise ValueError('unknown class "%s" (use one of: %s)' % (name, ', '.join(self.class_names)))
+            class_ids.append((name, self.class_names.index(name)))
+        if now is None:
+            now = time.time()
+        ring = self.rings[resolution]
+        # Only copy the raw counts while holding the lock (so the probe is
+        # held up as little as possible), and build the result after
+        with self.lock:
+            tags, frames, counts = ring.copy(sources, [c for n, c in class_ids])
+        buckets = ring.buckets(start, end, now)
+        result = {
+            'resolution': resolution,
+            'seconds': ring.width,
+            'times': [b * ring.width for b in buckets],
+            'sources': {}
+        }
+        for source_id in sources:
+            values = { 'frames': ring.values(frames[source_id], tags, buckets) }
+            for name, class_id in class_ids:
+                values[name] = ring.values(counts[(source_id, class_id)], tags, buckets)
+            result['sources'][str(source_id)] = values
+        return result
+
+
+#
+# The HTTP endpoint. The main request is:
+#
+#   GET /stats?resolution=minute&last=3600&source=3&class=person
+#
+# All of the parameters are optional:
+#   resolution   second, minute (the default), or hour
+#   last         how many seconds back from now to go (the default is as
+#                far back as that resolution keeps)
+#   start, end   alternatively, a range of times (seconds since the epoch)
+#   source       a source id (may be repeated; the default is all of them)
+#   class        a class name (may be repeated; the default is all of them)
+#
+# Other parts of the program can add their own (parameterless) pages to
+# "pages" below, e.g., "/pacing" (see "exports.py").
+#
+
+# Other pages served (path -> function returning the JSON body)
+pages = {}
+
+# Return the query parameter "name" as a number of seconds (or "default" if
+# it is not there). Raises ValueError if it is not a (finite) number.
+def _seconds(params, name, default):
+    if name not in params:
+        return default
+    text = params[name][0]
+    try:
+        value = float(text)
+    except ValueError:
+        value = float('nan')
+    if not math.isfinite(value):
+        raise ValueError('"%s" must be a number of seconds, not "%s"' % (name, text))
+    return value
+
+# Return the source ids in the query parameters (or None, for all of them).
+# Raises ValueError if any is not a number (unknown ones are left to "query").
+def _sources(params):
+    if 'source' not in params:
+        return None
+    sources = []
+    for text in params['source']:
+        try:
+            sources.append(int(text))
+        except ValueError:
+            raise ValueError('"source" must be a source id, not "%s"' % text)
+    return sources
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path in pages:
+            self._reply(200, pages[url.path]())
+            return
+        if url.path != '/stats':
+            self._reply(404, { 'error': 'not found (try /stats)' })
+            return
+        params = urllib.parse.parse_qs(url.query)
+        try:
+            now = time.time()
+            resolution = params.get('resolution', ['minute'])[0]
+            end = _seconds(params, 'end', now)
+            if 'start' in params:
+                start = _seconds(params, 'start', 0)
+            elif 'last' in params:
+                last = _seconds(params, 'last', 0)
+                if last < 0:
+                    raise ValueError('"last" must not be negative')
+                start = end - last
+            else:
+                start = 0
+            sources = _sources(params)
+            classes = params['class'] if 'class' in params else None
+            result = self.server.store.query(resolution, start, end, sources, classes, now)
+        except ValueError as e:
+            self._reply(400, { 'error': str(e) })
+            return
+        self._reply(200, result)
+
+    # Don't log every request on the terminal
+    def log_message(self, format, *args):
+        pass
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+# Serve the statistics from "store" on this port, in a background thread
+def serve(store, port):
+    server = _Server(('', port), _Handler)
+    server.store = store
+    thread = threading.Thread(target=server.serve_forever, name='stats-http')
+    thread.daemon = True
+    thread.start()
+    return server